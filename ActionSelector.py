@@ -0,0 +1,132 @@
+import numpy as np
+
+class ActionSelector:
+   def __init__(self, n_actions = 9, seed = None, block_size = 4096):
+      """Initializes an epsilon-greedy action selector backed by one seeded NumPy generator
+      Uniform randoms and exploration actions are drawn in blocks, so a single-car loop only pays
+      for a list lookup per draw instead of a call into the random generators
+
+      Args:
+         n_actions (int): the number of actions to pick from
+         seed (int): the seed of the random generator, None for fresh entropy
+         block_size (int): the number of draws to make at once
+      """
+      self.n_actions = n_actions
+      self.block_size = block_size
+      self.rng = np.random.default_rng(seed)
+      self.refill()
+
+   def refill(self):
+      """Draws the next block of uniform randoms and exploration actions"""
+      self.block_state = self.rng.bit_generator.state
+      self.uniform = self.rng.random(self.block_size)
+      self.explore_actions = self.rng.integers(self.n_actions, size=self.block_size)
+      self.uniform_list = self.uniform.tolist()
+      self.explore_list = self.explore_actions.tolist()
+      self.position = 0
+
+   def next(self):
+      """Consumes one draw
+
+      Returns:
+         the position of the draw in the current block
+      """
+      if self.position == self.block_size:
+         self.refill()
+      position = self.position
+      self.position += 1
+      return position
+
+   def chance(self, probability):
+      """Decides whether an event with the given probability happens
+
+      Args:
+         probability (float): the probability of the event
+
+      Returns:
+         True if the event happens, False otherwise
+      """
+      return self.uniform_list[self.next()] <= probability
+
+   def integer(self, n):
+      """Picks an integer uniformly at random
+
+      Args:
+         n (int): the number of integers to pick from
+
+      Returns:
+         an int in range [0, n)
+      """
+      return int(self.uniform_list[self.next()] * n)
+
+   def select(self, q, epsilon):
+      """Picks an action epsilon-greedily for a single state
+
+      Args:
+         q (array): the q-values of the state's actions
+         epsilon (float): the probability of exploring
+
+      Returns:
+         the index of the action
+      """
+      position = self.next()
+      if self.uniform_list[position] <= epsilon:
+         return self.explore_list[position]
+      return int(q.argmax())
+
+   def draw(self, n):
+      """Consumes n draws at once
+
+      Args:
+         n (int): the number of draws
+
+      Returns:
+         uniform (array): the uniform randoms
+         explore_actions (array): the exploration actions
+      """
+      if n == 0:
+         return self.uniform[:0], self.explore_actions[:0]
+      uniform = []
+      explore_actions = []
+      while n > 0:
+         if self.position == self.block_size:
+            self.refill()
+         count = min(n, self.block_size - self.position)
+         uniform.append(self.uniform[self.position:self.position + count])
+         explore_actions.append(self.explore_actions[self.position:self.position + count])
+         self.position += count
+         n -= count
+      if len(uniform) == 1:
+         return uniform[0], explore_actions[0]
+      return np.concatenate(uniform), np.concatenate(explore_actions)
+
+   def select_batch(self, q_rows, epsilon):
+      """Picks an action epsilon-greedily for many states at once
+
+      Args:
+         q_rows (matrix): the q-values of each state's actions, one row per state
+         epsilon (float or array): the probability of exploring, for every state or per state
+
+      Returns:
+         the index of the action for each state
+      """
+      uniform, explore_actions = self.draw(len(q_rows))
+      return np.where(uniform <= epsilon, explore_actions, q_rows.argmax(axis=1))
+
+   def get_state(self):
+      """Captures the state of the selector
+
+      Returns:
+         a JSON serializable dictionary the selector can be restored from
+      """
+      return {"bit_generator": self.block_state, "position": self.position}
+
+   def set_state(self, state):
+      """Restores the selector from get_state()
+
+      Args:
+         state (dict): the captured state
+      """
+      self.rng.bit_generator.state = state["bit_generator"]
+      self.refill()
+      self.position = state["position"]
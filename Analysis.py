@@ -1,132 +1,202 @@
 from ValueIteration import ValueIteration
 from QLearning import QLearning
+from BatchedQLearning import BatchedQLearning
 from SARSA import SARSA
-import csv
+import Sweep
+import Results
+import Profiler
+import Convergence
+import functools
+import json
 import time
-import os
 
-def write_csv(filename, rows, header):
-   """ Writes to a CSV
-   
+def valid_crash_type(spec):
+   """Crash type 1 is only run on the R-track"""
+   return spec["crash_type"] == 0 or spec["track"].endswith("R-track-1.txt")
+
+# Streams of a trial's seed, so testing and evaluation do not replay the draws of training.
+# Training uses the trial seed itself, and Q-Learning's replay already uses stream 1
+TEST_STREAM = 2
+EVALUATION_STREAM = 3
+STOPPING_STREAM = 4
+
+def stream_seed(spec, stream):
+   """Derives the seed of one random stream of a trial
+
+   Args:
+      spec (dict): the hyperparameters of the trial
+      stream (int): the stream to seed
+
+   Returns:
+      the seed of the stream, for np.random.default_rng
+   """
+   return [Sweep.trial_seed(spec), stream]
+
+def evaluation_columns(model, spec):
+   """Summarizes many seeded rollouts of a trained model's policy
+
+   Args:
+      model (ValueIteration, QLearning or SARSA): the trained model
+      spec (dict): the hyperparameters of the trial, used to seed the rollouts
+
+   Returns:
+      the mean steps, the bounds of its 95% confidence interval, the finish rate and the crash rate
+   """
+   stats = model.evaluate(n_rollouts = 1000, seed = stream_seed(spec, EVALUATION_STREAM), crash_type = spec["crash_type"])
+   return [stats["mean_steps"], stats["ci95"][0], stats["ci95"][1], stats["finish_rate"], stats["crash_rate"]]
+
+EVALUATION_HEADER = ["mean_steps", "ci95_low", "ci95_high", "finish_rate", "crash_rate"]
+
+def profiled_trial(trial_fn, spec):
+   """Runs a trial with the profiler enabled, appending its summary to the result row
+
    Args:
-      filename (string): the filename to write to
-      rows (matrix): the data to write
-      header(array): the header row
+      trial_fn (function): the function taking a spec and returning a result row
+      spec (dict): the hyperparameters of the trial
+
+   Returns:
+      the result row of the trial, followed by the JSON profiler summary
    """
-   with open(filename, 'w', newline="", encoding='UTF8') as f:
-      writer = csv.writer(f)
+   Profiler.reset()
+   Profiler.enable()
+   try:
+      row = trial_fn(spec)
+   finally:
+      Profiler.disable()
+   return row + [json.dumps(Profiler.summary())]
+
+def sweep(trial_fn, specs, writer, workers, profile):
+   """Runs a sweep, profiling every trial if asked to
 
-      # write the header
-      writer.writerow(header)
+   Args:
+      trial_fn (function): the function taking a spec and returning a result row
+      specs (array): the hyperparameters of each trial
+      writer (CsvWriter or ResultsWriter): where the result rows are written, with a "profile" column last if profiling
+      workers (int): the number of worker processes, None for one per core, 1 to run in this process
+      profile (bool): whether to record per-phase timings and counters for each trial
+   """
+   if profile:
+      trial_fn = functools.partial(profiled_trial, trial_fn)
+   Sweep.run_sweep(trial_fn, specs, writer, workers)
 
-      # write the data
-      for row in rows:
-         writer.writerow(row)
+def profile_header(header, profile):
+   """Adds the profile column to a header when profiling"""
+   return header + ["profile"] if profile else header
 
-csv_rows = []
-def test_ValueIteration():
+def trial_test_ValueIteration(spec):
+   """Trains and tests Value Iteration for one set of hyperparameters"""
+   track = spec["track"]
+   crash_type = spec["crash_type"]
+   model = ValueIteration(track)
+   train_start = time.time()
+   past_values, num_train_iters = model.train(discount = spec["discount"], threshold = spec["threshold"], crash_type = crash_type, backend = "numpy")
+   train_end = time.time()
+   num_test_iters, steps = model.test(crash_type = crash_type, seed = stream_seed(spec, TEST_STREAM))
+   test_end = time.time()
+   training_time = train_end - train_start
+   test_time = test_end - train_end
+   return [track, crash_type, spec["discount"], spec["threshold"], num_train_iters, num_test_iters, training_time, test_time]
+
+def test_ValueIteration(workers = None, profile = False):
    """Tests various values of hyperparameters for Value Iteration"""
    tracks = ["./L-track-1.txt", "O-track-1.txt", "R-track-1.txt"]
 
    discount_values = [.75, .85, .9, .95, .99]
    threshold_values = [.05, .1, .2]
 
-   for track in tracks:
-      for discount in discount_values:
-         for threshold in threshold_values:
-            for crash_type in [0, 1]:
-               if crash_type == 1 and track != "R-track-1.txt":
-                  continue
-               os.system("cls")
-               print("Track: " + track)
-               print("Discount: " + str(discount))
-               print("Threshold: " + str(threshold))
-               print("Crash Type " + str(crash_type))
-               model = ValueIteration(track)
-               train_start = time.time()
-               past_values, num_train_iters = model.train(discount = discount, threshold = threshold, crash_type = crash_type)
-               train_end = time.time()
-               num_test_iters, steps = model.test(crash_type = crash_type)
-               test_end = time.time()
-               training_time = train_end - train_start
-               test_time = test_end - train_end
-               csv_rows.append([track, crash_type, discount, threshold, num_train_iters, num_test_iters, training_time, test_time])
+   specs = Sweep.expand_grid(track = tracks, discount = discount_values, threshold = threshold_values, crash_type = [0, 1])
+   specs = [spec for spec in specs if valid_crash_type(spec)]
 
    header = ["track", "crash_type", "discount", "threshold", "num_train_iters", "num_test_iters", "training_time", "test_time"]
+   writer = Sweep.CsvWriter('ValueIterationEvaluation.csv', profile_header(header, profile), ["track", "crash_type", "discount", "threshold"])
+   sweep(trial_test_ValueIteration, specs, writer, workers, profile)
 
-   write_csv('ValueIterationEvaluation.csv', csv_rows, header)
-
-def experiment_ValueIteration():
-   """ Performs the data collection for 10 runs of Value Iteration"""
-   csv_rows = []
+def trial_ValueIteration(spec):
+   """Trains and tests Value Iteration with the optimal hyperparameters"""
    optimal_discount = .9
    optimal_threshold = .1
+   max_iters = 1000
+   model = ValueIteration(spec["track"])
+   past_values, num_train_iters = model.train(discount = optimal_discount, threshold = optimal_threshold, crash_type = spec["crash_type"], max_iter=max_iters, backend = "numpy")
+   num_test_iters, steps = model.test(crash_type = spec["crash_type"], seed = stream_seed(spec, TEST_STREAM))
+   return [spec["track"], spec["iteration"], spec["crash_type"], num_train_iters, num_test_iters, past_values, steps] + evaluation_columns(model, spec)
 
+def experiment_ValueIteration(workers = None, profile = False):
+   """ Performs the data collection for 10 runs of Value Iteration"""
    tracks = ["L-track-1.txt", "O-track-1.txt", "R-track-1.txt"]
-   for track in tracks:
-      for i in range(10):
-         for crash_type in [0, 1]:
-            max_iters = 1000
-            if crash_type == 1 and track != "R-track-1.txt":
-               continue
-            print("Track: " + track)
-            print("Iteration: " + str(i))
-            model = ValueIteration(track)
-            past_values, num_train_iters = model.train(discount = optimal_discount, threshold = optimal_threshold, crash_type = crash_type, max_iter=max_iters)
-            num_test_iters, steps = model.test(crash_type = crash_type)
-            csv_rows.append([track, i, crash_type, num_train_iters, num_test_iters, past_values, steps])
-   header = ["track", "iteration", "crash_type", "num_train_iters", "num_test_iters", "past_values", "steps"]
-   write_csv('ValueIterationExperiment.csv', csv_rows, header)
-
-def experiment_QLearning():
+   specs = Sweep.expand_grid(track = tracks, iteration = range(10), crash_type = [0, 1])
+   specs = [spec for spec in specs if valid_crash_type(spec)]
+
+   header = ["track", "iteration", "crash_type", "num_train_iters", "num_test_iters", "past_values", "steps"] + EVALUATION_HEADER
+   writer = Results.ResultsWriter('ValueIterationExperiment', profile_header(header, profile), ["track", "iteration", "crash_type"], ["past_values", "steps"])
+   sweep(trial_ValueIteration, specs, writer, workers, profile)
+
+# The optimal hyperparameters of Q-Learning
+QLEARNING_HYPERPARAMETERS = {"discount": .8, "epsilon": .6, "decay": .9999, "learning_rate": .8, "num_iter": 1000}
+
+def trial_QLearning(spec):
+   """Trains and tests Q-Learning with the optimal hyperparameters"""
+   model = QLearning(spec["track"])
+   num_train_iters = model.train(crash_type = spec["crash_type"], seed = Sweep.trial_seed(spec), **QLEARNING_HYPERPARAMETERS)
+   num_test_iters, steps = model.test(crash_type = spec["crash_type"], seed = stream_seed(spec, TEST_STREAM))
+   return [spec["track"], spec["iteration"], spec["crash_type"], num_train_iters, num_test_iters, steps] + evaluation_columns(model, spec)
+
+def experiment_QLearning(workers = None, profile = False):
    """ Performs the data collection for 10 runs of Q-Learning"""
-   csv_rows = []
-   discount = .9
-   epsilon = .6
-   decay = .9999
-   learning_rate = .8
-   max_iters = 10000
    tracks = ["L-track-1.txt", "O-track-1.txt", "R-track-1.txt"]
-   for track in tracks:
-      for i in range(10):
-         for crash_type in [0, 1]:
-            max_iters = 1000
-            discount = .8
-            if crash_type == 1 and track != "R-track-1.txt":
-               continue
-            print("Track: " + track)
-            print("Iteration: " + str(i))
-            model = QLearning(track)
-            num_train_iters = model.train(discount = discount, epsilon = epsilon, decay = decay, learning_rate = learning_rate, num_iter = max_iters, crash_type = crash_type)
-            num_test_iters, steps = model.test(crash_type = crash_type)
-            csv_rows.append([track, i, crash_type, num_train_iters, num_test_iters, steps])
-   header = ["track", "iteration", "crash_type", "num_train_iters", "num_test_iters", "steps"]
-   write_csv('QLearningExperiment-2.csv', csv_rows, header)
-
-def experiment_SARSA():
+   specs = Sweep.expand_grid(track = tracks, iteration = range(10), crash_type = [0, 1])
+   specs = [spec for spec in specs if valid_crash_type(spec)]
+
+   header = ["track", "iteration", "crash_type", "num_train_iters", "num_test_iters", "steps"] + EVALUATION_HEADER
+   writer = Results.ResultsWriter('QLearningExperiment-2', profile_header(header, profile), ["track", "iteration", "crash_type"], ["num_train_iters", "steps"])
+   sweep(trial_QLearning, specs, writer, workers, profile)
+
+def experiment_QLearning_batched():
+   """ Performs the data collection for 10 runs of Q-Learning, training the runs of each track and crash type together in lockstep"""
+   tracks = ["L-track-1.txt", "O-track-1.txt", "R-track-1.txt"]
+   configurations = Sweep.expand_grid(track = tracks, crash_type = [0, 1])
+   configurations = [configuration for configuration in configurations if valid_crash_type(configuration)]
+
+   header = ["track", "iteration", "crash_type", "num_train_iters", "num_test_iters", "steps"] + EVALUATION_HEADER
+   writer = Results.ResultsWriter('QLearningExperiment-batched', header, ["track", "iteration", "crash_type"], ["num_train_iters", "steps"])
+   for configuration in configurations:
+      specs = [dict(configuration, iteration = iteration) for iteration in range(10)]
+      specs = [spec for spec in specs if not writer.completed(spec)]
+      if not specs:
+         continue
+      model = BatchedQLearning(configuration["track"], len(specs))
+      model.train(crash_type = configuration["crash_type"], seed = Sweep.trial_seed(specs[0]), **QLEARNING_HYPERPARAMETERS)
+      for k, spec in enumerate(specs):
+         agent = model.agent(k)
+         num_test_iters, steps = agent.test(crash_type = spec["crash_type"], seed = stream_seed(spec, TEST_STREAM))
+         writer.write(spec, [spec["track"], spec["iteration"], spec["crash_type"], model.num_train_iter[k], num_test_iters, steps] + evaluation_columns(agent, spec))
+      print("Finished " + str(configuration))
+
+# Greedy rollouts every 200 episodes, stopping after 5 evaluations in a row without a 1% improvement
+SARSA_STOPPING = {"every": 200, "n_rollouts": 200, "patience": 5, "tolerance": .01, "min_finish_rate": .9}
+
+def trial_SARSA(spec):
+   """Trains and tests SARSA with the optimal hyperparameters, stopping once its greedy policy plateaus"""
+   if spec["track"] == "R-track-1.txt":
+      ipe = 10000
+   else:
+      ipe = 1000
+   model = SARSA(spec["track"])
+   num_train_iters, episode_rewards = model.train(num_episodes = 10000, iter_per_episode = ipe, discount = .9, epsilon = .1, decay = .99, learning_rate = .1, crash_type = spec["crash_type"], seed = Sweep.trial_seed(spec), stopping = Convergence.GreedyEvaluation(seed = stream_seed(spec, STOPPING_STREAM), **SARSA_STOPPING))
+   num_test_iters, steps = model.test(crash_type = spec["crash_type"], seed = stream_seed(spec, TEST_STREAM))
+   return [spec["track"], spec["iteration"], spec["crash_type"], num_train_iters, model.stop_episode, num_test_iters, steps, episode_rewards] + evaluation_columns(model, spec)
+
+def experiment_SARSA(workers = None, profile = False):
    """ Performs the data collection for 10 runs of SARSA"""
-   csv_rows = []
-   
    tracks = ["L-track-1.txt", "O-track-1.txt", "R-track-1.txt"]
-   for track in tracks:
-      if track == "R-track-1.txt":
-         ipe = 10000
-      else:
-         ipe = 1000
-      for i in range(10):
-         for crash_type in [0, 1]:
-            if crash_type == 1 and track != "R-track-1.txt":
-               continue
-            
-            print("Track: " + track)
-            print("Iteration: " + str(i))
-            model = SARSA(track)
-            num_train_iters, episode_rewards = model.train(num_episodes = 10000, iter_per_episode = ipe, discount = .9, epsilon = .1, decay = .99, learning_rate = .1, crash_type = crash_type)
-            num_test_iters, steps = model.test(crash_type = crash_type)
-            csv_rows.append([track, i, crash_type, num_train_iters, num_test_iters, steps, episode_rewards])
-   header = ["track", "iteration", "crash_type", "num_train_iters", "num_test_iters", "steps", "episode_rewards"]
-   write_csv('SARSAExperiment.csv', csv_rows, header)
-
-experiment_ValueIteration()
-experiment_QLearning()
-experiment_SARSA()
+   specs = Sweep.expand_grid(track = tracks, iteration = range(10), crash_type = [0, 1])
+   specs = [spec for spec in specs if valid_crash_type(spec)]
+
+   header = ["track", "iteration", "crash_type", "num_train_iters", "stop_episode", "num_test_iters", "steps", "episode_rewards"] + EVALUATION_HEADER
+   writer = Results.ResultsWriter('SARSAExperiment-2', profile_header(header, profile), ["track", "iteration", "crash_type"], ["steps", "episode_rewards"])
+   sweep(trial_SARSA, specs, writer, workers, profile)
+
+if __name__ == "__main__":
+   experiment_ValueIteration()
+   experiment_QLearning()
+   experiment_SARSA()
\ No newline at end of file
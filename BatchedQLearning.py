@@ -0,0 +1,159 @@
+import numpy as np
+from Racetrack import Racetrack
+from StateCodec import StateCodec
+from QLearning import QLearning
+import Checkpoint
+import Profiler
+
+# --------- Batched Q-Learning ---------
+class BatchedQLearning:
+   def __init__(self, filename, n_agents, compact = False, dtype = np.float64):
+      """Initializes K independent Q-Learning agents on one track, their q tables stacked in one array
+
+      Args:
+         filename (string): the name of the file containing the Racetrack
+         n_agents (int): the number of agents K
+         compact (bool): whether to only store the states reachable from the start line, as flat tables
+         dtype (type): the float type of the q tables, such as np.float32 or np.float16
+      """
+      self.filename = filename
+      self.n_agents = n_agents
+      self.options = {"n_agents": n_agents, "compact": compact, "dtype": np.dtype(dtype).name}
+      self.track = Racetrack(filename)
+
+      self.codec = StateCodec(*self.track.grid.shape)
+      self.compact = compact
+      self.dtype = dtype
+      # Tables are flat, one row per state code, or per compact index when compact
+      self.n_states = self.track.state_indexer().n_states if compact else self.codec.n_states
+      self.table_shape = (self.n_states,)
+      self.actions = [[-1, -1], [-1, 0], [0, -1], [0, 0], [0, 1], [1, 0], [1, 1], [-1, 1], [1, -1]]
+      self.q_table = np.zeros((n_agents,) + self.table_shape + (len(self.actions),), dtype=dtype)
+
+   @Profiler.timed("BatchedQLearning.train")
+   def train(self, discount = .9, epsilon = .4, decay = .99, learning_rate = .8, num_iter = 1000, crash_type = 0, seed = None):
+      """Trains every agent for num_iter episodes, advancing all of them one step at a time in lockstep
+      Each agent follows QLearning.train exactly, with its own episodes, epsilon and learning rate,
+      so its results are distributed like those of a separate QLearning.train call.
+      Every hyperparameter can be one value for all agents or an array with one value per agent
+
+      Args:
+         discount (float or array): the discount factor to be applied
+         epsilon (float or array): the percentage of exploration to take
+         decay (float or array): the amount of decay to apply
+         learning_rate (float or array): how fast the algorithm should learn
+         num_iter (int): the number of episodes/iterations to take
+         crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+         seed (int): the seed of the random generator shared by the agents, None for fresh entropy
+
+      Returns:
+         self.num_train_iter (matrix): the number of iterations of each episode it took to reach the finish line, one list per agent
+      """
+      # Per-agent values are stored as lists, so the hyperparameters can be saved as JSON
+      self.hyperparameters = {name: np.asarray(value).tolist() for name, value in
+         {"discount": discount, "epsilon": epsilon, "decay": decay, "learning_rate": learning_rate, "num_iter": num_iter, "crash_type": crash_type}.items()}
+      self.hyperparameters["seed"] = seed
+      model = self.track.transition_model(crash_type, self.compact)
+      rng = np.random.default_rng(seed)
+      n_actions = len(self.actions)
+
+      def per_agent(value):
+         return np.broadcast_to(np.asarray(value, dtype=np.float64), (self.n_agents,)).copy()
+      discount = per_agent(discount)
+      epsilon = per_agent(epsilon)
+      decay = per_agent(decay)
+      learning_rate = per_agent(learning_rate)
+
+      q_table = self.q_table
+      start_states = model.encode(*np.array(self.track.start_line).T, 0, 0)
+      num_train_iter = np.zeros((self.n_agents, num_iter), dtype=np.int64)
+      episode = np.zeros(self.n_agents, dtype=np.int64)
+      steps = np.zeros(self.n_agents, dtype=np.int64)
+      state = start_states[rng.integers(len(start_states), size=self.n_agents)]
+
+      active = np.arange(self.n_agents) if num_iter > 0 else np.arange(0)
+      while len(active):
+         current = state[active]
+         rows = np.arange(len(active))
+         q_vals = q_table[active, current]
+
+         # Epsilon greedy, then the nondeterministic step keeps the choice with probability 0.8
+         uniform = rng.random((2, len(active)))
+         explore = rng.integers(n_actions, size=len(active))
+         index = np.where(uniform[0] <= epsilon[active], explore, q_vals.argmax(axis=1))
+         action_index = np.where(uniform[1] <= .8, index, 3)
+         q_val = q_vals[rows, action_index]
+
+         # Adjust reward if we crash or finish
+         finished = model.finished[current, action_index]
+         reward = np.where(finished, 0, np.where(model.crashed[current, action_index], -10, -1))
+         next_state = model.next_state[current, action_index]
+
+         # Update q-table values, each agent writes its own table so the scatter never collides
+         max_q_value_prime = q_table[active, next_state].max(axis=1)
+         q_table[active, current, index] += learning_rate[active] * (reward + discount[active] * max_q_value_prime - q_val)
+         state[active] = next_state
+         steps[active] += 1
+
+         # Agents that finished start their next episode
+         if finished.any():
+            done = active[finished]
+            num_train_iter[done, episode[done]] = steps[done]
+            Profiler.count("episodes", len(done))
+            Profiler.count("steps", int(steps[done].sum()))
+            episode[done] += 1
+            steps[done] = 0
+            epsilon[done] *= decay[done]
+            learning_rate[done] = np.where(learning_rate[done] > 0.01, learning_rate[done] * decay[done], learning_rate[done])
+            state[done] = start_states[rng.integers(len(start_states), size=len(done))]
+            active = active[episode[active] < num_iter]
+
+      self.num_train_iter = num_train_iter.tolist()
+      return self.num_train_iter
+
+   def agent(self, k):
+      """Gets one agent as a QLearning instance sharing its q table, so it can be tested, evaluated or saved
+
+      Args:
+         k (int): the index of the agent
+
+      Returns:
+         the QLearning instance
+      """
+      learner = QLearning.__new__(QLearning)
+      learner.filename = self.filename
+      learner.options = {"compact": self.compact, "dtype": np.dtype(self.dtype).name}
+      learner.track = self.track
+      learner.codec = self.codec
+      learner.n_states = self.n_states
+      learner.compact = self.compact
+      learner.table_shape = self.table_shape
+      learner.actions = self.actions
+      learner.q_table = self.q_table[k]
+      if hasattr(self, "num_train_iter"):
+         learner.num_train_iter = self.num_train_iter[k]
+      if hasattr(self, "hyperparameters"):
+         learner.hyperparameters = {name: value[k] if isinstance(value, list) else value for name, value in self.hyperparameters.items()}
+      return learner
+
+   def save(self, path):
+      """Saves the stacked q tables with their metadata
+
+      Args:
+         path (string): the directory to write to
+      """
+      Checkpoint.save(self, path, ["q_table"])
+
+   @classmethod
+   def load(cls, path, mmap_mode = None, filename = None):
+      """Loads a saved batch of agents
+
+      Args:
+         path (string): the directory the agents were saved to
+         mmap_mode (string): None to read the tables into memory, or a numpy memory map mode such as "r"
+         filename (string): the racetrack file, if it has moved since the agents were saved
+
+      Returns:
+         the loaded agents
+      """
+      return Checkpoint.load(cls, path, mmap_mode, filename)
@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+import numpy as np
+import Helpers
+from Car import Car
+from Racetrack import Racetrack
+from ActionSelector import ActionSelector
+from ValueIteration import ValueIteration
+from QLearning import QLearning
+from SARSA import SARSA
+
+TRACKS = ["L-track-1.txt", "O-track-1.txt", "R-track-1.txt"]
+
+def scale_track(filename, factor, directory):
+   """Writes a scaled-up copy of a track, every cell becoming a factor x factor block
+
+   Args:
+      filename (string): the name of the file containing the racetrack
+      factor (int): the number of times to repeat every cell in each direction
+      directory (string): the directory to write the scaled track to
+
+   Returns:
+      the name of the scaled track's file
+   """
+   with open(filename, "r") as f:
+      f.readline()
+      lines = [line.strip() for line in f if line.strip()]
+   scaled = ["".join(cell * factor for cell in line) for line in lines for _ in range(factor)]
+   name = os.path.join(directory, os.path.splitext(os.path.basename(filename))[0] + "-x" + str(factor) + ".txt")
+   with open(name, "w") as f:
+      f.write(str(len(scaled)) + "," + str(len(scaled[0])) + "\n")
+      f.write("\n".join(scaled) + "\n")
+   return name
+
+def time_call(function, repeat = 5, number = 1):
+   """Times a function
+
+   Args:
+      function (function): the function to time, called without arguments
+      repeat (int): the number of timing runs
+      number (int): the number of calls in each timing run
+
+   Returns:
+      a dictionary with the best and median seconds per call, and how it was measured
+   """
+   runs = [seconds / number for seconds in timeit.Timer(function).repeat(repeat=repeat, number=number)]
+   return {"seconds": min(runs), "median": statistics.median(runs), "repeat": repeat, "number": number}
+
+def micro_benchmarks(quick = False):
+   """Times the per-step hot paths of the simulator on the R-track
+
+   Args:
+      quick (bool): whether to take fewer measurements
+
+   Returns:
+      a dictionary of benchmark name to timing
+   """
+   repeat = 3 if quick else 7
+   number = 2000 if quick else 20000
+   track = Racetrack("R-track-1.txt")
+   start = track.start_line[0]
+   # A move across open track and one through the wall
+   clear_move = ([start[0], start[1]], [start[0] - 3, start[1] + 2])
+   crash_move = ([start[0], start[1]], [start[0] + 5, start[1] - 5])
+   q = np.random.default_rng(0).random(9)
+   selector = ActionSelector(9, 0)
+   car = Car(start[0], start[1])
+
+   results = {}
+   results["car_step"] = time_call(lambda: car.step(1, -1), repeat, number)
+   # Moving one cell diagonally and back again keeps the car on open track next to the start line
+   advancing = Car(start[0], start[1])
+   def advance():
+      advancing.advance(-1, 1, track)
+      advancing.advance(1, -1, track)
+      advancing.advance(1, -1, track)
+      advancing.advance(-1, 1, track)
+   results["car_advance"] = time_call(advance, repeat, number // 4)
+   results["did_crash"] = time_call(lambda: Helpers.did_crash(*clear_move, track), repeat, number)
+   results["did_crash_wall"] = time_call(lambda: Helpers.did_crash(*crash_move, track), repeat, number)
+   results["crossed_finish"] = time_call(lambda: Helpers.crossed_finish(*clear_move, track), repeat, number)
+   results["get_nearest_start"] = time_call(lambda: Helpers.get_nearest_start(track, crash_move[1]), repeat, number)
+   results["epsilon_greedy"] = time_call(lambda: Helpers.epsilon_greedy(q, .1), repeat, number)
+   results["action_selector"] = time_call(lambda: selector.select(q, .1), repeat, number)
+   track.enable_collision_cache()
+   results["did_crash_cached"] = time_call(lambda: Helpers.did_crash(*clear_move, track), repeat, number)
+   return results
+
+def macro_benchmarks(tracks, episodes = 5, quick = False):
+   """Times model building and training on whole tracks
+   Transition models are built before training is timed, so the training numbers only cover the learners' loops
+
+   Args:
+      tracks (array): the names of the track files
+      episodes (int): the number of Q-Learning and SARSA episodes to time
+      quick (bool): whether to take fewer measurements
+
+   Returns:
+      a dictionary of benchmark name to timing
+   """
+   repeat = 1 if quick else 3
+   results = {}
+   for filename in tracks:
+      name = os.path.splitext(os.path.basename(filename))[0]
+      results[name + "/transition_model"] = time_call(lambda: Racetrack(filename).transition_model(), repeat)
+
+      def value_iteration_sweep():
+         model = ValueIteration(filename)
+         model.track.transition_model()
+         return lambda: model.train(max_iter=model.num_train_iter + 1, backend="numpy")
+      results[name + "/value_iteration_sweep"] = time_call(value_iteration_sweep(), repeat)
+
+      def q_learning_episodes():
+         model = QLearning(filename)
+         model.track.transition_model()
+         def train():
+            # Every run starts from the same table, so every run does the same work
+            model.q_table.fill(0)
+            model.train(num_iter=episodes, seed=0)
+         return train
+      results[name + "/q_learning_episodes"] = time_call(q_learning_episodes(), repeat)
+
+      def sarsa_episodes():
+         np.random.seed(0)
+         model = SARSA(filename)
+         model.track.transition_model()
+         initial = model.q_table.copy()
+         def train():
+            np.copyto(model.q_table, initial)
+            model.train(num_episodes=episodes, iter_per_episode=1000, seed=0)
+         return train
+      results[name + "/sarsa_episodes"] = time_call(sarsa_episodes(), repeat)
+   return results
+
+def run(quick = False, scales = (2,), episodes = 5, only = None):
+   """Runs the benchmark suite
+
+   Args:
+      quick (bool): whether to take fewer measurements
+      scales (array): the factors to scale the R-track up by for the synthetic tracks
+      episodes (int): the number of Q-Learning and SARSA episodes to time
+      only (string): only keep the benchmarks whose name contains this, None to keep all of them
+
+   Returns:
+      a JSON serializable dictionary of the environment and the timing of every benchmark
+   """
+   with tempfile.TemporaryDirectory() as directory:
+      tracks = TRACKS + [scale_track("R-track-1.txt", factor, directory) for factor in scales]
+      results = micro_benchmarks(quick)
+      results.update(macro_benchmarks(tracks, episodes, quick))
+   if only is not None:
+      results = {name: timing for name, timing in results.items() if only in name}
+   return {
+      "environment": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(), "time": time.strftime("%Y-%m-%d %H:%M:%S")},
+      "results": results,
+   }
+
+def compare(baseline, current, tolerance = .1):
+   """Compares two benchmark runs
+
+   Args:
+      baseline (dict): the stored run, as returned by run()
+      current (dict): the new run
+      tolerance (float): the fraction a benchmark may slow down by before it counts as a regression
+
+   Returns:
+      rows (array): [name, baseline seconds, current seconds, ratio, flag] for every benchmark in both runs
+      regressions (array): the names of the benchmarks that slowed down by more than the tolerance
+   """
+   rows = []
+   regressions = []
+   for name, timing in current["results"].items():
+      if name not in baseline["results"]:
+         continue
+      before = baseline["results"][name]["seconds"]
+      ratio = timing["seconds"] / before if before else float("inf")
+      flag = ""
+      if ratio > 1 + tolerance:
+         flag = "REGRESSION"
+         regressions.append(name)
+      elif ratio < 1 / (1 + tolerance):
+         flag = "faster"
+      rows.append([name, before, timing["seconds"], ratio, flag])
+   return rows, regressions
+
+def format_seconds(seconds):
+   """Formats a duration with a readable unit"""
+   for unit, scale in [("s", 1), ("ms", 1e-3), ("us", 1e-6)]:
+      if seconds >= scale:
+         return "{:.3f} {}".format(seconds / scale, unit)
+   return "{:.1f} ns".format(seconds / 1e-9)
+
+if __name__ == "__main__":
+   parser = argparse.ArgumentParser(description="Benchmarks the racetrack simulator and learners")
+   parser.add_argument("--output", default="benchmark.json", help="the file to write the results to")
+   parser.add_argument("--compare", help="a stored run to compare against, regressions make the exit code 1")
+   parser.add_argument("--current", help="compare this stored run instead of running the suite")
+   parser.add_argument("--tolerance", type=float, default=.1, help="the slowdown allowed before flagging a regression")
+   parser.add_argument("--quick", action="store_true", help="take fewer measurements")
+   parser.add_argument("--scale", type=int, nargs="*", default=[2], help="the factors to scale the R-track up by")
+   parser.add_argument("--episodes", type=int, default=5, help="the number of Q-Learning and SARSA episodes to time")
+   parser.add_argument("--only", help="only keep the benchmarks whose name contains this")
+   args = parser.parse_args()
+
+   if args.current:
+      with open(args.current, "r") as f:
+         current = json.load(f)
+   else:
+      current = run(args.quick, args.scale, args.episodes, args.only)
+      with open(args.output, "w") as f:
+         json.dump(current, f, indent=2)
+      for name, timing in current["results"].items():
+         print("{:<40}{:>14}".format(name, format_seconds(timing["seconds"])))
+
+   if args.compare:
+      with open(args.compare, "r") as f:
+         baseline = json.load(f)
+      rows, regressions = compare(baseline, current, args.tolerance)
+      print("{:<40}{:>14}{:>14}{:>8}".format("benchmark", "baseline", "current", "ratio"))
+      for name, before, after, ratio, flag in rows:
+         print("{:<40}{:>14}{:>14}{:>8.2f}  {}".format(name, format_seconds(before), format_seconds(after), ratio, flag))
+      sys.exit(1 if regressions else 0)
@@ -1,5 +1,10 @@
 import random
+import Helpers
+
 class Car:
+   # A fixed set of attributes, so a car has no per-instance __dict__
+   __slots__ = ("x", "y", "vx", "vy", "ax", "ay")
+
    def __init__(self, y, x):
       """Initializes a car
       
@@ -49,4 +54,31 @@ class Car:
       self.y = position[0]
       self.x = position[1]
       self.vx = 0
-      self.vy = 0
\ No newline at end of file
+      self.vy = 0
+
+   def advance(self, ay, ax, track, crash_type = 0):
+      """Steps the car and resolves the move against the track, updating the car in place
+      Gives the same outcome as a TransitionModel lookup without building any position lists, unless the car crashes
+
+      Args:
+         ay (int): acceleration in the y-direction
+         ax (int): acceleration in the x-direction
+         track (Racetrack): the track the car drives on
+         crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+
+      Returns:
+         finished (bool): whether the move reached the finish line
+         crashed (bool): whether the car was stopped, by the wall or by the finish line
+      """
+      y = self.y
+      x = self.x
+      self.step(ay, ax)
+      finished, crash_point = Helpers.trace_move(y, x, self.y, self.x, track)
+      if crash_point is None:
+         return finished, False
+
+      # Reaching the finish line also stops the car, but only running into the wall sends it back to the start
+      if crash_type and not finished:
+         crash_point = Helpers.get_nearest_start(track, crash_point)
+      self.crash_reset(crash_point)
+      return finished, True
\ No newline at end of file
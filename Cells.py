@@ -0,0 +1,16 @@
+import numpy as np
+
+# Cell types stored in Racetrack.grid
+TRACK = 0
+WALL = 1
+START = 2
+FINISH = 3
+
+# Cell type of each character of the text format, anything other than #, S and F is track
+CELL_TYPES = np.full(256, TRACK, dtype=np.uint8)
+CELL_TYPES[ord("#")] = WALL
+CELL_TYPES[ord("S")] = START
+CELL_TYPES[ord("F")] = FINISH
+
+# Character of each cell type in the text format
+CHARACTERS = np.array([ord("."), ord("#"), ord("S"), ord("F")], dtype=np.uint8)
\ No newline at end of file
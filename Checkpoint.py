@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+def track_hash(track):
+   """Hashes the layout of a track, so tables are only loaded for the track they were learned on
+
+   Args:
+      track (Racetrack): the track to hash
+
+   Returns:
+      the hex digest of the track
+   """
+   return hashlib.sha256("\n".join(track.track).encode("UTF8")).hexdigest()
+
+def save(learner, path, tables, training_state = None):
+   """Writes the tables of a learner as .npy files with a meta.json next to them
+   Each file is written to a temporary name first, so an interrupted save never leaves a torn checkpoint
+
+   Args:
+      learner (object): the ValueIteration, QLearning or SARSA instance to save
+      path (string): the directory to write to
+      tables (array): the names of the table attributes to write
+      training_state (dict): anything needed to resume training, stored in the metadata
+   """
+   os.makedirs(path, exist_ok=True)
+   for name in tables:
+      temporary = os.path.join(path, name + ".tmp.npy")
+      np.save(temporary, np.asarray(getattr(learner, name)))
+      os.replace(temporary, os.path.join(path, name + ".npy"))
+
+   metadata = {
+      "class": type(learner).__name__,
+      "filename": learner.filename,
+      "track_hash": track_hash(learner.track),
+      "options": learner.options,
+      "tables": list(tables),
+      "hyperparameters": getattr(learner, "hyperparameters", {}),
+      "num_train_iter": getattr(learner, "num_train_iter", 0),
+      "training_state": training_state,
+   }
+   temporary = os.path.join(path, "meta.tmp.json")
+   with open(temporary, "w", encoding="UTF8") as f:
+      json.dump(metadata, f)
+   os.replace(temporary, os.path.join(path, "meta.json"))
+
+def read_metadata(path):
+   """Reads the metadata of a saved learner
+
+   Args:
+      path (string): the directory the learner was saved to
+
+   Returns:
+      the metadata dictionary, or None if nothing was saved there
+   """
+   filename = os.path.join(path, "meta.json")
+   if not os.path.exists(filename):
+      return None
+   with open(filename, "r", encoding="UTF8") as f:
+      return json.load(f)
+
+def load_tables(learner, path, mmap_mode = None):
+   """Replaces the tables of a learner with saved ones
+
+   Args:
+      learner (object): the learner to load into, built on the same track
+      path (string): the directory the learner was saved to
+      mmap_mode (string): None to read the tables into memory, or a numpy memory map mode such as "r"
+         to share one saved table between processes without copying it
+
+   Returns:
+      the metadata dictionary
+   """
+   metadata = read_metadata(path)
+   if metadata is None:
+      raise FileNotFoundError("No saved learner in " + path)
+   if metadata["track_hash"] != track_hash(learner.track):
+      raise ValueError(path + " was saved for a different track than " + learner.filename)
+   for name in metadata["tables"]:
+      table = np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+      # Tables saved with one axis per state component are read as flat tables, one row per state
+      current = getattr(learner, name, None)
+      if current is not None and table.shape != current.shape and table.size == current.size:
+         table = table.reshape(current.shape)
+      setattr(learner, name, table)
+   learner.num_train_iter = metadata["num_train_iter"]
+   return metadata
+
+def load(cls, path, mmap_mode = None, filename = None):
+   """Builds a learner from a saved one
+
+   Args:
+      cls (type): the learner class
+      path (string): the directory the learner was saved to
+      mmap_mode (string): None to read the tables into memory, or a numpy memory map mode such as "r"
+      filename (string): the racetrack file, if it has moved since the learner was saved
+
+   Returns:
+      the loaded learner
+   """
+   metadata = read_metadata(path)
+   if metadata is None:
+      raise FileNotFoundError("No saved learner in " + path)
+   if metadata["class"] != cls.__name__:
+      raise ValueError(path + " holds a " + metadata["class"] + ", not a " + cls.__name__)
+
+   # Building the learner must not disturb the global random state, SARSA draws its initial table from it
+   state = np.random.get_state()
+   options = dict(metadata["options"])
+   for option in ["dtype", "policy_dtype"]:
+      if options.get(option) is not None:
+         options[option] = np.dtype(options[option])
+   learner = cls(filename or metadata["filename"], **options)
+   np.random.set_state(state)
+
+   load_tables(learner, path, mmap_mode)
+   learner.hyperparameters = metadata["hyperparameters"]
+   return learner
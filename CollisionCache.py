@@ -0,0 +1,225 @@
+from collections import OrderedDict
+import numpy as np
+import Helpers
+import Profiler
+
+class CollisionCache:
+   def __init__(self, track, maxsize = None):
+      """Initializes a memoized collision table for a track
+      The outcome of a move only depends on its start point and displacement, so results are keyed by (y, x, dy, dx)
+
+      Args:
+         track (Racetrack): the track the moves are made on
+         maxsize (int): the number of entries to keep in least recently used order, or None to keep every entry
+      """
+      self.track = track
+      self.maxsize = maxsize
+      self.entries = OrderedDict() if maxsize else {}
+      self.hits = 0
+      self.misses = 0
+
+      # Dense tables over every cell and every displacement in [-5, 5], allocated by the first batched lookup
+      # and filled as moves are traced, or all at once by precompute(). known marks the filled entries
+      self.finished = None
+      self.crashed = None
+      self.crash_points = None
+      self.known = None
+      self.complete = False
+
+   def allocate(self):
+      """Allocates empty dense tables"""
+      rows, cols = self.track.grid.shape
+      self.finished = np.zeros((rows, cols, 11, 11), dtype=bool)
+      self.crashed = np.zeros((rows, cols, 11, 11), dtype=bool)
+      self.crash_points = np.zeros((rows, cols, 11, 11, 2), dtype=np.int32)
+      self.known = np.zeros((rows, cols, 11, 11), dtype=bool)
+
+   @Profiler.timed("collision_precompute")
+   def precompute(self):
+      """Fills the dense tables for every cell of the track and every displacement in [-5, 5]"""
+      rows, cols = self.track.grid.shape
+      y, x, dy, dx = np.meshgrid(np.arange(rows), np.arange(cols), np.arange(-5, 6), np.arange(-5, 6), indexing="ij")
+      old_positions = np.stack((y, x), axis=-1).reshape(-1, 2)
+      new_positions = np.stack((y + dy, x + dx), axis=-1).reshape(-1, 2)
+      finished, crashed, crash_points = Helpers.trace_segments(old_positions, new_positions, self.track)
+
+      self.finished = finished.reshape(rows, cols, 11, 11)
+      self.crashed = crashed.reshape(rows, cols, 11, 11)
+      self.crash_points = crash_points.astype(np.int32).reshape(rows, cols, 11, 11, 2)
+      self.known = np.ones((rows, cols, 11, 11), dtype=bool)
+      self.complete = True
+
+   def lookup(self, y, x, dy, dx):
+      """Finds the outcome of a move, computing and storing it on a miss
+
+      Args:
+         y (int): the y-position the move starts from
+         x (int): the x-position the move starts from
+         dy (int): the displacement in the y-direction
+         dx (int): the displacement in the x-direction
+      Returns:
+         the (finished, crash_point) result of Helpers.walk_move
+         The crash point may be shared between calls and must not be modified
+      """
+      if self.finished is not None and -5 <= dy <= 5 and -5 <= dx <= 5 and 0 <= y < self.finished.shape[0] and 0 <= x < self.finished.shape[1] and self.known[y, x, dy + 5, dx + 5]:
+         self.hits += 1
+         if Profiler.enabled:
+            Profiler.count("cache_hits")
+         crash_point = None
+         if self.crashed[y, x, dy + 5, dx + 5]:
+            crash_point = self.crash_points[y, x, dy + 5, dx + 5].tolist()
+         return bool(self.finished[y, x, dy + 5, dx + 5]), crash_point
+
+      key = (y, x, dy, dx)
+      entry = self.entries.get(key)
+      if entry is not None:
+         self.hits += 1
+         if Profiler.enabled:
+            Profiler.count("cache_hits")
+         if self.maxsize:
+            self.entries.move_to_end(key)
+         return entry
+
+      self.misses += 1
+      if Profiler.enabled:
+         Profiler.count("cache_misses")
+      entry = Helpers.walk_move(y, x, y + dy, x + dx, self.track)
+      self.entries[key] = entry
+      if self.maxsize and len(self.entries) > self.maxsize:
+         self.entries.popitem(last=False)
+      return entry
+
+   def lookup_batch(self, y, x, dy, dx):
+      """Finds the outcomes of many moves at once
+      Without a maxsize, moves from a cell of the track by at most 5 in each direction are kept in the dense tables,
+      every other move is kept in the entries like lookup does. Only moves not seen before are traced, each of them once
+
+      Args:
+         y (array): the y-positions the moves start from
+         x (array): the x-positions the moves start from
+         dy (array): the displacements in the y-direction
+         dx (array): the displacements in the x-direction
+      Returns:
+         the (finished, crashed, crash_points) result of Helpers.trace_segments
+      """
+      y, x, dy, dx = (np.asarray(component, dtype=np.int64).reshape(-1) for component in (y, x, dy, dx))
+      rows, cols = self.track.grid.shape
+      finished = np.zeros(len(y), dtype=bool)
+      crashed = np.zeros(len(y), dtype=bool)
+      crash_points = np.zeros((len(y), 2), dtype=np.int64)
+
+      dense = (y >= 0) & (y < rows) & (x >= 0) & (x < cols) & (np.abs(dy) <= 5) & (np.abs(dx) <= 5)
+      if self.maxsize:
+         dense[:] = False
+      moves = np.flatnonzero(dense)
+      if len(moves):
+         if self.finished is None:
+            self.allocate()
+         cell = ((y[moves] * cols + x[moves]) * 11 + dy[moves] + 5) * 11 + dx[moves] + 5
+         known = self.known.reshape(-1)
+         missing = np.unique(cell[~known[cell]])
+         if len(missing):
+            self.trace_dense(missing)
+         self.hits += len(moves) - len(missing)
+         self.misses += len(missing)
+         Profiler.count("cache_hits", len(moves) - len(missing))
+         Profiler.count("cache_misses", len(missing))
+         finished[moves] = self.finished.reshape(-1)[cell]
+         crashed[moves] = self.crashed.reshape(-1)[cell]
+         crash_points[moves] = self.crash_points.reshape(-1, 2)[cell]
+
+      moves = np.flatnonzero(~dense)
+      if len(moves):
+         finished[moves], crashed[moves], crash_points[moves] = self.lookup_entries(y[moves], x[moves], dy[moves], dx[moves])
+      return finished, crashed, crash_points
+
+   def trace_dense(self, cells):
+      """Traces moves and stores their outcomes in the dense tables
+
+      Args:
+         cells (array): the flat indices of the moves in the dense tables
+      """
+      cols = self.track.grid.shape[1]
+      rest, dx = np.divmod(cells, 11)
+      rest, dy = np.divmod(rest, 11)
+      y, x = np.divmod(rest, cols)
+      dy -= 5
+      dx -= 5
+      finished, crashed, crash_points = Helpers.trace_segments(np.stack((y, x), axis=-1), np.stack((y + dy, x + dx), axis=-1), self.track)
+      self.finished.reshape(-1)[cells] = finished
+      self.crashed.reshape(-1)[cells] = crashed
+      self.crash_points.reshape(-1, 2)[cells] = crash_points
+      self.known.reshape(-1)[cells] = True
+
+   def lookup_entries(self, y, x, dy, dx):
+      """Finds the outcomes of many moves through the entries, tracing the ones not stored yet in one batch
+
+      Args:
+         y (array): the y-positions the moves start from
+         x (array): the x-positions the moves start from
+         dy (array): the displacements in the y-direction
+         dx (array): the displacements in the x-direction
+      Returns:
+         the (finished, crashed, crash_points) result of Helpers.trace_segments
+      """
+      keys = list(zip(y.tolist(), x.tolist(), dy.tolist(), dx.tolist()))
+      finished = np.zeros(len(keys), dtype=bool)
+      crashed = np.zeros(len(keys), dtype=bool)
+      crash_points = np.zeros((len(keys), 2), dtype=np.int64)
+
+      # Read the stored moves first, so storing new ones cannot evict them halfway through
+      missing = {}
+      for i, key in enumerate(keys):
+         entry = self.entries.get(key)
+         if entry is None:
+            missing.setdefault(key, []).append(i)
+            continue
+         if self.maxsize:
+            self.entries.move_to_end(key)
+         finished[i] = entry[0]
+         if entry[1] is not None:
+            crashed[i] = True
+            crash_points[i] = entry[1]
+      self.hits += len(keys) - len(missing)
+      self.misses += len(missing)
+      Profiler.count("cache_hits", len(keys) - len(missing))
+      Profiler.count("cache_misses", len(missing))
+      if not missing:
+         return finished, crashed, crash_points
+
+      new_keys = np.array(list(missing), dtype=np.int64).reshape(-1, 4)
+      new_finished, new_crashed, new_crash_points = Helpers.trace_segments(new_keys[:, :2], new_keys[:, :2] + new_keys[:, 2:], self.track)
+      for key, moved, is_finished, is_crashed, crash_point in zip(missing, missing.values(), new_finished.tolist(), new_crashed.tolist(), new_crash_points.tolist()):
+         finished[moved] = is_finished
+         crashed[moved] = is_crashed
+         crash_points[moved] = crash_point
+         self.entries[key] = (is_finished, crash_point if is_crashed else None)
+         if self.maxsize and len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+      return finished, crashed, crash_points
+
+   def clear(self):
+      """Empties the cache and resets its statistics"""
+      self.entries.clear()
+      self.finished = None
+      self.crashed = None
+      self.crash_points = None
+      self.known = None
+      self.complete = False
+      self.hits = 0
+      self.misses = 0
+
+   def info(self):
+      """Reports the cache statistics
+
+      Returns:
+         a dictionary with the hits, misses, hit rate, number of stored entries and maxsize
+      """
+      lookups = self.hits + self.misses
+      return {
+         "hits": self.hits,
+         "misses": self.misses,
+         "hit_rate": self.hits / lookups if lookups else 0.0,
+         "entries": len(self.entries) + (0 if self.known is None else int(self.known.sum())),
+         "maxsize": self.maxsize,
+      }
\ No newline at end of file
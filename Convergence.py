@@ -0,0 +1,172 @@
+import collections
+import numpy as np
+import Evaluation
+
+# Stopping criteria for QLearning.train and SARSA.train
+# After every episode the learner calls update(learner, model, episode, steps, q_delta, finished), and stops training once it returns True.
+# reset() is called at the start of every training run, so one criterion can be reused across runs
+
+class QDelta:
+   def __init__(self, threshold = 1e-3, window = 100):
+      """Stops once no q-value has changed by more than threshold in the last window episodes
+
+      Args:
+         threshold (float): the largest change of a q-value still counted as converged
+         window (int): the number of episodes the changes have to stay below the threshold for
+      """
+      self.threshold = threshold
+      self.window = window
+      self.reset()
+
+   def reset(self):
+      """Forgets the episodes seen so far"""
+      self.deltas = collections.deque(maxlen=self.window)
+
+   def update(self, learner, model, episode, steps, q_delta, finished = True):
+      """Records an episode
+
+      Args:
+         learner (QLearning or SARSA): the learner being trained
+         model (TransitionModel): the transition model it trains on
+         episode (int): the index of the episode
+         steps (int): the number of steps of the episode
+         q_delta (float): the largest change of a q-value during the episode
+         finished (bool): whether the episode reached the finish line, rather than being cut short by a step limit
+
+      Returns:
+         True to stop training, False otherwise
+      """
+      self.deltas.append(q_delta)
+      return len(self.deltas) == self.window and max(self.deltas) <= self.threshold
+
+class EpisodeLength:
+   def __init__(self, window = 100, tolerance = .01, min_finish_rate = .9):
+      """Stops once the average length of the last window finished episodes is within tolerance of the window before it
+      Episodes cut short by a step limit are left out of the averages, and a plateau only counts
+      once at least min_finish_rate of the last window episodes finished
+
+      Args:
+         window (int): the number of episodes to average over
+         tolerance (float): the largest relative change of the average still counted as a plateau
+         min_finish_rate (float): the fraction of the last window episodes that have to finish before a plateau counts
+      """
+      self.window = window
+      self.tolerance = tolerance
+      self.min_finish_rate = min_finish_rate
+      self.reset()
+
+   def reset(self):
+      """Forgets the episodes seen so far"""
+      # The lengths of the finished episodes, and whether each of the last window episodes finished
+      self.lengths = collections.deque(maxlen=2 * self.window)
+      self.finishes = collections.deque(maxlen=self.window)
+
+   def update(self, learner, model, episode, steps, q_delta, finished = True):
+      """Records an episode
+
+      Args:
+         learner (QLearning or SARSA): the learner being trained
+         model (TransitionModel): the transition model it trains on
+         episode (int): the index of the episode
+         steps (int): the number of steps of the episode
+         q_delta (float): the largest change of a q-value during the episode
+         finished (bool): whether the episode reached the finish line, rather than being cut short by a step limit
+
+      Returns:
+         True to stop training, False otherwise
+      """
+      self.finishes.append(finished)
+      if finished:
+         self.lengths.append(steps)
+      if len(self.lengths) < 2 * self.window or np.mean(self.finishes) < self.min_finish_rate:
+         return False
+      lengths = np.array(self.lengths)
+      before = lengths[:self.window].mean()
+      after = lengths[self.window:].mean()
+      return abs(after - before) <= self.tolerance * before
+
+class GreedyEvaluation:
+   def __init__(self, every = 100, n_rollouts = 200, patience = 3, tolerance = .01, min_finish_rate = .9, seed = 0):
+      """Evaluates the greedy policy every few episodes, and stops once its mean steps to finish stop improving
+
+      Args:
+         every (int): the number of episodes between evaluations
+         n_rollouts (int): the number of rollouts of each evaluation
+         patience (int): the number of evaluations in a row without improvement to stop after
+         tolerance (float): the relative decrease of the best mean steps that counts as an improvement
+         min_finish_rate (float): the fraction of rollouts that have to finish before a plateau counts
+         seed (int): the seed of the rollouts, the same for every evaluation so they are comparable
+      """
+      self.every = every
+      self.n_rollouts = n_rollouts
+      self.patience = patience
+      self.tolerance = tolerance
+      self.min_finish_rate = min_finish_rate
+      self.seed = seed
+      self.reset()
+
+   def reset(self):
+      """Forgets the episodes seen so far"""
+      self.best = np.inf
+      self.stale = 0
+      # The (episodes trained, mean steps, finish rate) of every evaluation
+      self.history = []
+
+   def update(self, learner, model, episode, steps, q_delta, finished = True):
+      """Records an episode, evaluating the greedy policy every few of them
+
+      Args:
+         learner (QLearning or SARSA): the learner being trained
+         model (TransitionModel): the transition model it trains on
+         episode (int): the index of the episode
+         steps (int): the number of steps of the episode
+         q_delta (float): the largest change of a q-value during the episode
+         finished (bool): whether the episode reached the finish line, rather than being cut short by a step limit
+
+      Returns:
+         True to stop training, False otherwise
+      """
+      if (episode + 1) % self.every:
+         return False
+      stats = Evaluation.evaluate(model, learner.greedy_policy(), self.n_rollouts, self.seed)
+      self.history.append((episode + 1, stats["mean_steps"], stats["finish_rate"]))
+      if stats["finish_rate"] < self.min_finish_rate:
+         self.stale = 0
+         return False
+      if stats["mean_steps"] < self.best * (1 - self.tolerance):
+         self.best = stats["mean_steps"]
+         self.stale = 0
+      else:
+         self.stale += 1
+      return self.stale >= self.patience
+
+class AnyOf:
+   def __init__(self, *criteria):
+      """Stops as soon as any of several criteria would
+
+      Args:
+         criteria (array): the stopping criteria
+      """
+      self.criteria = criteria
+
+   def reset(self):
+      """Forgets the episodes seen so far"""
+      for criterion in self.criteria:
+         criterion.reset()
+
+   def update(self, learner, model, episode, steps, q_delta, finished = True):
+      """Records an episode with every criterion
+
+      Args:
+         learner (QLearning or SARSA): the learner being trained
+         model (TransitionModel): the transition model it trains on
+         episode (int): the index of the episode
+         steps (int): the number of steps of the episode
+         q_delta (float): the largest change of a q-value during the episode
+         finished (bool): whether the episode reached the finish line, rather than being cut short by a step limit
+
+      Returns:
+         True to stop training, False otherwise
+      """
+      # Every criterion sees every episode, so none of them falls behind
+      return any([criterion.update(learner, model, episode, steps, q_delta, finished) for criterion in self.criteria])
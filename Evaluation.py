@@ -0,0 +1,128 @@
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+import Profiler
+
+@Profiler.timed("evaluate")
+def evaluate(model, policy, n_rollouts = 1000, seed = None, max_steps = 1000, exact = False):
+   """Runs many noisy rollouts of a greedy policy at once
+   Every rollout starts at rest on a random starting point. Each step applies the policy's action with
+   probability 0.8 and no acceleration otherwise, like the learners' test() methods
+
+   Args:
+      model (TransitionModel): the transition model of the track, full or compact
+      policy (array): the action index to take in each state of the model
+      n_rollouts (int): the number of rollouts to run
+      seed (int): the seed of the random generator
+      max_steps (int): the number of steps after which an unfinished rollout is stopped
+      exact (bool): whether to also compute the exact expected number of steps from each starting point
+
+   Returns:
+      a dictionary with the mean, standard deviation, quantiles and 95% confidence interval of the steps to finish,
+      the fraction of rollouts that finished, the crash rate and, if exact is set, the expected steps per starting point
+   """
+   rng = np.random.default_rng(seed)
+   policy = np.asarray(policy)
+   starts = start_states(model)
+   state = starts[rng.integers(len(starts), size=n_rollouts)]
+   steps = np.zeros(n_rollouts, dtype=np.int64)
+   crashes = np.zeros(n_rollouts, dtype=np.int64)
+   done = np.zeros(n_rollouts, dtype=bool)
+
+   active = np.arange(n_rollouts)
+   for step in range(max_steps):
+      if len(active) == 0:
+         break
+      current = state[active]
+      action = np.where(rng.random(len(active)) <= .8, policy[current], 3)
+      finished = model.finished[current, action]
+      crashes[active] += model.crashed[current, action] & ~finished
+      state[active] = model.next_state[current, action]
+      steps[active] += 1
+      done[active] = finished
+      active = active[~finished]
+
+   Profiler.count("rollout_steps", int(steps.sum()))
+   mean = steps.mean()
+   std = steps.std(ddof=1) if n_rollouts > 1 else 0.0
+   half_width = 1.96 * std / np.sqrt(n_rollouts)
+   results = {
+      "n_rollouts": n_rollouts,
+      "mean_steps": float(mean),
+      "std_steps": float(std),
+      "quantiles": {str(q): float(np.quantile(steps, q)) for q in [.05, .25, .5, .75, .95]},
+      "ci95": (float(mean - half_width), float(mean + half_width)),
+      "finish_rate": float(done.mean()),
+      "crash_rate": float((crashes > 0).mean()),
+      "crashes_per_rollout": float(crashes.mean()),
+   }
+   if exact:
+      results["expected_steps"] = dict(zip(map(tuple, start_positions(model).tolist()), expected_steps(model, policy)[starts].tolist()))
+   return results
+
+def start_positions(model):
+   """Lists the starting points of the model's track
+
+   Args:
+      model (TransitionModel): the transition model of the track
+
+   Returns:
+      the starting points, one [y, x] per row
+   """
+   return np.array(model.track.start_line, dtype=np.int64).reshape(-1, 2)
+
+def start_states(model):
+   """Finds the states of a car at rest on each starting point
+
+   Args:
+      model (TransitionModel): the transition model of the track
+
+   Returns:
+      the state index of each starting point
+   """
+   start = start_positions(model)
+   return np.asarray(model.encode(start[:, 0], start[:, 1], 0, 0))
+
+@Profiler.timed("expected_steps")
+def expected_steps(model, policy):
+   """Solves the Markov chain of a greedy policy for the expected number of steps to finish
+   t(s) = 1 + 0.8 * t(policy successor) + 0.2 * t(no acceleration successor), where finishing moves contribute nothing
+
+   Args:
+      model (TransitionModel): the transition model of the track, full or compact
+      policy (array): the action index to take in each state of the model
+
+   Returns:
+      the expected number of steps from every state, inf where the policy never finishes
+   """
+   policy = np.asarray(policy)
+   states = np.arange(model.n_states)
+   successors = np.stack((model.next_state[states, policy], model.next_state[states, 3]), axis=1)
+   probabilities = np.where(np.stack((model.finished[states, policy], model.finished[states, 3]), axis=1), 0, np.array([.8, .2]))
+
+   # Only states that can reach the finish line can have a finite expectation
+   finishes = np.flatnonzero(model.finished[states, policy] | model.finished[states, 3])
+   can_finish = np.zeros(model.n_states, dtype=bool)
+   can_finish[finishes] = True
+   transitions = scipy.sparse.csr_matrix((probabilities.reshape(-1), (np.repeat(states, 2), successors.reshape(-1))), shape=(model.n_states, model.n_states))
+   reverse = transitions.T.tocsr()
+   frontier = finishes
+   while len(frontier):
+      predecessors = np.unique(reverse[frontier].indices)
+      frontier = predecessors[~can_finish[predecessors]]
+      can_finish[frontier] = True
+
+   # The expectation is only finite if every possible successor can finish as well
+   while True:
+      leaks = (probabilities > 0) & ~can_finish[successors]
+      never_finishes = can_finish & leaks.any(axis=1)
+      if not never_finishes.any():
+         break
+      can_finish[never_finishes] = False
+
+   solvable = np.flatnonzero(can_finish)
+   restricted = transitions[solvable][:, solvable]
+   system = scipy.sparse.identity(len(solvable), format="csc") - restricted.tocsc()
+   expected = np.full(model.n_states, np.inf)
+   expected[solvable] = scipy.sparse.linalg.spsolve(system, np.ones(len(solvable)))
+   return expected
@@ -1,56 +1,193 @@
 import math
 import random
 import numpy as np
+import Cells
+import Profiler
+
+def trace_segment(old_position, new_position, track):
+   """Determines whether a move finishes and where it crashes in a single pass
+   Served from the track's collision cache when one is enabled, otherwise walks the line with walk_move
+   Neither position is modified
 
-def did_crash(old_position, new_position, track):
-   """Finds the point cross just before crashing
-   Uses Besenham's algorithm to find all matrix points crossed in the line taken
-   
    Args:
       old_position (array): the previous position [y, x]
       new_position (array): the new position [y, x]
       track (Racetrack): the track that you are currently using
    Returns:
-      the last valid point before encountering the wall. If no wall encountered, returns (None, None)
+      finished (bool): True if a finishing point is encountered before the wall
+      crash_point (array): the point returned by did_crash [y, x], or None if no wall or finish is encountered
+   """
+   return trace_move(old_position[0], old_position[1], new_position[0], new_position[1], track)
+
+def trace_move(y, x, end_y, end_x, track):
+   """Version of trace_segment taking the coordinates as ints, so no position lists need to be built
+
+   Args:
+      y (int): the previous y-position
+      x (int): the previous x-position
+      end_y (int): the new y-position
+      end_x (int): the new x-position
+      track (Racetrack): the track that you are currently using
+   Returns:
+      finished (bool): True if a finishing point is encountered before the wall
+      crash_point (array): the point returned by did_crash [y, x], or None if no wall or finish is encountered
+   """
+   if Profiler.enabled:
+      Profiler.count("crash_checks")
+   if track.collision_cache is not None:
+      return track.collision_cache.lookup(y, x, end_y - y, end_x - x)
+   return walk_move(y, x, end_y, end_x, track)
+
+def walk_move(y, x, end_y, end_x, track):
+   """Determines whether a move finishes and where it crashes in a single pass
+   Uses Besenham's algorithm to walk the matrix points crossed in the line taken, stopping as soon as the outcome is known
+   A crash point list is only built when the move finishes or crashes
+
+   Args:
+      y (int): the previous y-position
+      x (int): the previous x-position
+      end_y (int): the new y-position
+      end_x (int): the new x-position
+      track (Racetrack): the track that you are currently using
+   Returns:
+      finished (bool): True if a finishing point is encountered before the wall
+      crash_point (array): the point returned by did_crash [y, x], or None if no wall or finish is encountered
    """
+   wall = track.wall_set
+   finish = track.finish_set
+
+   # If we start in the wall, we stay where we are
+   if (y, x) in wall:
+      return False, [y, x]
+   finished = (y, x) in finish
+
    # Bresenham's algorithm
-   dx = abs(new_position[1] - old_position[1])
-   dy = abs(new_position[0] - old_position[0])
-   sx = -1 if old_position[1] > new_position[1] else 1
-   sy = -1 if old_position[0] > new_position[0] else 1
+   dx = abs(end_x - x)
+   dy = abs(end_y - y)
+   sx = -1 if x > end_x else 1
+   sy = -1 if y > end_y else 1
    err = dx - dy
-    
-   line_points = []
-   
-   # Calculate all points on line
-   while old_position[0] != new_position[0] or old_position[1] != new_position[1]:
-      line_points.append([old_position[0], old_position[1]])
+
+   prev_y = y
+   prev_x = x
+   while y != end_y or x != end_x:
       e2 = 2 * err
-        
+
       if e2 > -dy:
          err -= dy
-         old_position[1] += sx
-        
+         x += sx
+
       if e2 < dx:
          err += dx
-         old_position[0] += sy
-            
-   line_points.append([new_position[0], new_position[1]])
+         y += sy
+
+      # Reaching the finish line stops the car there
+      # Running into the wall returns the point just before contact was made
+      if (y, x) in finish:
+         return True, [y, x]
+      if (y, x) in wall:
+         return finished, [prev_y, prev_x]
+      prev_y = y
+      prev_x = x
+
+   return finished, None
+
+@Profiler.timed("ray_casts")
+def trace_segments(old_positions, new_positions, track):
+   """Batched version of trace_segment
+   Walks the Bresenham lines of every move at once, one point per iteration
+
+   Args:
+      old_positions (matrix): the previous positions, one [y, x] per row
+      new_positions (matrix): the new positions, one [y, x] per row
+      track (Racetrack): the track that you are currently using
+   Returns:
+      finished (array): True where a finishing point is encountered before the wall
+      crashed (array): True where trace_segment would return a crash point
+      crash_points (matrix): the crash point [y, x] of each move, only meaningful where crashed is True
+   """
+   old_positions = np.asarray(old_positions, dtype=np.int64).reshape(-1, 2)
+   new_positions = np.asarray(new_positions, dtype=np.int64).reshape(-1, 2)
+   Profiler.count("crash_checks", len(old_positions))
+   y = old_positions[:, 0].copy()
+   x = old_positions[:, 1].copy()
+   end_y = new_positions[:, 0]
+   end_x = new_positions[:, 1]
+
+   # Bresenham's algorithm
+   dx = np.abs(end_x - x)
+   dy = np.abs(end_y - y)
+   sx = np.where(x > end_x, -1, 1)
+   sy = np.where(y > end_y, -1, 1)
+   err = dx - dy
+
+   cells = cell_types(track, y, x)
+   crashed = cells == Cells.WALL
+   finished = cells == Cells.FINISH
+   crash_points = old_positions.copy()
+
+   active = np.flatnonzero(~crashed & ((y != end_y) | (x != end_x)))
+   while len(active):
+      e2 = 2 * err[active]
+      step_x = e2 > -dy[active]
+      step_y = e2 < dx[active]
+      err[active] += np.where(step_y, dx[active], 0) - np.where(step_x, dy[active], 0)
+      x[active] += np.where(step_x, sx[active], 0)
+      y[active] += np.where(step_y, sy[active], 0)
+
+      cells = cell_types(track, y[active], x[active])
+      hit_finish = active[cells == Cells.FINISH]
+      hit_wall = active[cells == Cells.WALL]
+
+      # Reaching the finish line stops the car there
+      finished[hit_finish] = True
+      crash_points[hit_finish, 0] = y[hit_finish]
+      crash_points[hit_finish, 1] = x[hit_finish]
+      # Running into the wall keeps the point just before contact was made
+      crashed[hit_finish] = True
+      crashed[hit_wall] = True
+
+      active = active[(cells != Cells.FINISH) & (cells != Cells.WALL)]
+      active = active[(y[active] != end_y[active]) | (x[active] != end_x[active])]
+      crash_points[active, 0] = y[active]
+      crash_points[active, 1] = x[active]
+
+   return finished, crashed, crash_points
+
+def cell_types(track, y, x):
+   """Looks up the cell types of many points
+   Points outside of the track are treated as regular track cells
+
+   Args:
+      track (Racetrack): the track that you are currently using
+      y (array): the y-positions of the points
+      x (array): the x-positions of the points
+   Returns:
+      the Racetrack cell type of each point
+   """
+   rows, cols = track.grid.shape
+   inside = (y >= 0) & (y < rows) & (x >= 0) & (x < cols)
+   cells = track.grid[np.clip(y, 0, rows - 1), np.clip(x, 0, cols - 1)]
+   return np.where(inside, cells, Cells.TRACK)
+
+def did_crash(old_position, new_position, track):
+   """Finds the point cross just before crashing
+   Uses Besenham's algorithm to find all matrix points crossed in the line taken
    
+   Args:
+      old_position (array): the previous position [y, x]
+      new_position (array): the new position [y, x]
+      track (Racetrack): the track that you are currently using
+   Returns:
+      the last valid point before encountering the wall. If no wall encountered, returns (None, None)
+   """
    # If we run into the wall at any point on the line, return the point just before contact was made
    # This will simulate returning us to the nearest point on the track, in the case of "soft collisions"
    # If using "hard collisions", we can simply check if the value returned is not (None, None), and if it is not then we have to hard reset
-   prev_point = line_points[0]
-   if prev_point in track.wall:
-         return prev_point
-   for point in line_points[1:]:
-      if point in track.finish_line:
-         return point
-      if point in track.wall:
-         return prev_point
-      prev_point = point
-    
-   return (None, None)
+   finished, crash_point = trace_segment(old_position, new_position, track)
+   if crash_point is None:
+      return (None, None)
+   return crash_point
 
 def crossed_finish(old_position, new_position, track):
    """Determines whether a finishin point is encountered
@@ -64,43 +201,13 @@ def crossed_finish(old_position, new_position, track):
       True if a finishing point is encountered
       False otherwise
    """
-   # Bresenham's algorithm
-   dx = abs(new_position[1] - old_position[1])
-   dy = abs(new_position[0] - old_position[0])
-   sx = -1 if old_position[1] > new_position[1] else 1
-   sy = -1 if old_position[0] > new_position[0] else 1
-   err = dx - dy
-    
-   line_points = []
-   
-   # Calculate all points on line
-   while old_position[0] != new_position[0] or old_position[1] != new_position[1]:
-      line_points.append([old_position[0], old_position[1]])
-      e2 = 2 * err
-        
-      if e2 > -dy:
-         err -= dy
-         old_position[1] += sx
-        
-      if e2 < dx:
-         err += dx
-         old_position[0] += sy
-            
-   line_points.append([new_position[0], new_position[1]])
-   
-   # If we run into the wall at any point on the line, return the point just before contact was made
-   # This will simulate returning us to the nearest point on the track, in the case of "soft collisions"
-   # If using "hard collisions", we can simply check if the value returned is not (-1, -1), and if it is not then we have to hard reset
-   for point in line_points:
-      if point in track.wall:
-         return False
-      if point in track.finish_line:
-         return True
-    
-   return False
+   finished, crash_point = trace_segment(old_position, new_position, track)
+   return finished
+
 def get_nearest_start(track, position):
    """Finds the nearest starting position to current position
    Distance is determined by Euclidean distance
+   Points on the track are looked up in the track's precomputed reset map
    
    Args:
       track (Racetrack): the race track currently being used
@@ -109,15 +216,43 @@ def get_nearest_start(track, position):
    Returns:
       nearest_point (array): the starting point nearest to position [y, x]
    """
+   if Profiler.enabled:
+      Profiler.count("nearest_start_searches")
+   y, x = position[0], position[1]
+   if 0 <= y < track.grid.shape[0] and 0 <= x < track.grid.shape[1]:
+      return track.nearest_start[y, x].tolist()
+
    nearest_dist = 100000
    nearest_point = [10000, 10000]
    for point in track.start_line:
       distance = math.dist(point, position)
       if distance < nearest_dist:
          nearest_dist = distance
-         nearest_point = position
+         nearest_point = point
    return nearest_point
 
+@Profiler.timed("nearest_start")
+def get_nearest_starts(track, positions):
+   """Batched version of get_nearest_start
+   Positions on the track are gathered from the reset map in one go, any others are resolved one by one
+
+   Args:
+      track (Racetrack): the race track currently being used
+      positions (matrix): the current positions, one [y, x] per row
+
+   Returns:
+      the starting points nearest to each position, one [y, x] per row
+   """
+   positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+   Profiler.count("nearest_start_searches", len(positions))
+   rows, cols = track.grid.shape
+   inside = (positions[:, 0] >= 0) & (positions[:, 0] < rows) & (positions[:, 1] >= 0) & (positions[:, 1] < cols)
+   resets = positions.copy()
+   resets[inside] = track.nearest_start[positions[inside, 0], positions[inside, 1]]
+   for i in np.flatnonzero(~inside).tolist():
+      resets[i] = get_nearest_start(track, positions[i].tolist())
+   return resets
+
 def epsilon_greedy(q, epsilon):
    if random.random() <= epsilon:
       return np.random.randint(9)
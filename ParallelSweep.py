@@ -0,0 +1,85 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+# The shared arrays of the sweep, mapped once in every worker process by attach()
+arrays = {}
+blocks = []
+
+def share(array):
+   """Copies an array into a new block of shared memory
+
+   Args:
+      array (array): the array to share
+
+   Returns:
+      block (SharedMemory): the shared memory, to be closed and unlinked by the caller
+      spec (tuple): the (name, shape, dtype) a worker attaches to the array with
+      shared (array): the shared copy of the array
+   """
+   block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+   shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+   shared[...] = array
+   return block, (block.name, array.shape, array.dtype.str), shared
+
+def attach(specs):
+   """Maps the shared arrays into a worker process, used as the initializer of the worker pool
+
+   Args:
+      specs (dict): the (name, shape, dtype) of each shared array, by name
+   """
+   for name, (block_name, shape, dtype) in specs.items():
+      block = shared_memory.SharedMemory(name=block_name)
+      blocks.append(block)
+      arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+def row_blocks(rows, n_blocks):
+   """Splits the states on the track into blocks of whole rows of the track with about as many states each
+
+   Args:
+      rows (array): the track row of each state on the track, in increasing order
+      n_blocks (int): the number of blocks to aim for
+
+   Returns:
+      the bounds of the blocks, block i being states bounds[i]:bounds[i + 1]
+   """
+   cuts = np.linspace(0, len(rows), n_blocks + 1).astype(np.int64)[1:-1]
+   # Move every cut back to the first state of its row
+   cuts = np.searchsorted(rows, rows[np.minimum(cuts, len(rows) - 1)]) if len(rows) else cuts
+   return np.unique(np.concatenate(([0], cuts, [len(rows)]))).tolist()
+
+def sweep_block(start, stop, parity, discount):
+   """Does one synchronous Bellman sweep over a block of the states on the track
+   Reads values[parity] and writes the block's new values to values[1 - parity], along with its q-values and greedy actions.
+   Exactly the arithmetic of ValueIteration.train_numpy, so the results match it bit for bit
+
+   Args:
+      start (int): the first state of the block, as a position in on_track
+      stop (int): the end of the block, as a position in on_track
+      parity (int): which of the two value tables holds the previous values
+      discount (float): the amount of discount to be applied
+
+   Returns:
+      the largest decrease of any value in the block, 0 if there is none
+   """
+   old_value = arrays["values"][parity]
+   new_value = arrays["values"][1 - parity]
+   states = arrays["on_track"][start:stop]
+   next_state = arrays["next_state"][start:stop]
+   finished = arrays["finished"][start:stop]
+   reward = np.where(finished, 0, -1).astype(old_value.dtype)
+
+   # Finishing ends the race, otherwise the car moves with probability 0.8 and stays with probability 0.2
+   old_v = old_value[states]
+   new_v = np.where(finished, 0, old_value[next_state])
+   expected_value = new_v * 0.8 + old_v[:, None] * 0.2
+   new_q = reward + discount * expected_value
+
+   best_action = new_q.argmax(axis=1)
+   max_action_value = new_q[np.arange(len(states)), best_action]
+
+   arrays["q"][start:stop] = new_q
+   arrays["best_action"][start:stop] = best_action
+   new_value[states] = max_action_value
+   if len(states) == 0:
+      return 0
+   return (old_v - max_action_value).max()
@@ -0,0 +1,126 @@
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+from ValueIteration import ValueIteration
+import Checkpoint
+import Profiler
+
+class PolicyIteration(ValueIteration):
+   """Policy Iteration on the same tables as ValueIteration, so test(), evaluate() and save() work unchanged"""
+
+   @Profiler.timed("PolicyIteration.train")
+   def train(self, discount = .9, threshold = .1, crash_type = 0, max_iter = 100, solver = "direct", checkpoint_path = None, checkpoint_every = None, resume = False):
+      """Trains Policy Iteration
+      Each iteration evaluates the current policy exactly by solving the sparse linear system of its values,
+      then improves the policy greedily. Training stops once the improvement leaves the policy unchanged
+
+      Args:
+         discount (float): the amount of discount to be applied
+         threshold (float): unused, policy iteration stops once the policy is stable. Kept so it can be swapped in for ValueIteration
+         crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+         max_iter (int): the max number of policy evaluations to allow
+         solver (string): "direct" to solve each evaluation with a sparse LU factorization, or "iterative" to use
+            BiCGSTAB started from the previous policy's values
+         checkpoint_path (string): the directory to save checkpoints to and resume from
+         checkpoint_every (int): the number of iterations between checkpoints, None to never checkpoint
+         resume (bool): whether to continue from the checkpoint in checkpoint_path, if there is one
+
+      Returns:
+         past_value_difference (array): the largest change of any state's value in each iteration
+         self.num_train_iter (array): the number of policy evaluations it took for the policy to stop changing
+      """
+      if solver not in ("direct", "iterative"):
+         raise ValueError("Unknown solver: " + str(solver))
+      self.hyperparameters = {"discount": discount, "threshold": threshold, "crash_type": crash_type, "max_iter": max_iter, "solver": solver}
+      model = self.track.transition_model(crash_type, self.compact)
+
+      # Pick up where the last checkpoint left off
+      past_value_difference = []
+      metadata = Checkpoint.read_metadata(checkpoint_path) if resume else None
+      if metadata is not None and metadata["training_state"] is not None:
+         Checkpoint.load_tables(self, checkpoint_path)
+         past_value_difference = metadata["training_state"]["past_value_difference"]
+         if metadata["training_state"]["converged"]:
+            return past_value_difference, self.num_train_iter
+
+      value_table = self.value_table
+      q_table = self.q_table
+      policy_table = self.policy_table
+      actions = np.array(self.actions)
+
+      wall = model.wall
+      on_track = np.flatnonzero(~wall)
+      value_table[wall] = -1
+
+      # Rows of the linear system, one per state on the track
+      row = np.full(model.n_states, -1, dtype=np.int64)
+      row[on_track] = np.arange(len(on_track))
+      next_row = row[model.next_state[on_track]]
+      finished = model.finished[on_track]
+      reward = np.where(finished, 0, -1).astype(np.float64)
+
+      # Start from the greedy policy of the current values
+      policy = self.bellman_q(model, on_track, value_table, discount).argmax(axis=1)
+
+      converged = False
+      while self.num_train_iter < max_iter and not converged:
+         # Evaluate the policy: V(s) = r + discount * (0.8 * V(next) + 0.2 * V(s)), where V(next) is 0 after finishing
+         values = self.evaluate_policy(policy, next_row, finished, reward, discount, solver, value_table[on_track])
+         delta = float(np.abs(values - value_table[on_track]).max()) if len(on_track) else 0
+         value_table[on_track] = values
+
+         # Improve the policy, only switching action for a strictly better one so ties can't cycle
+         new_q = self.bellman_q(model, on_track, value_table, discount)
+         best_action = new_q.argmax(axis=1)
+         best_value = new_q[np.arange(len(on_track)), best_action]
+         current_value = new_q[np.arange(len(on_track)), policy]
+         improved = current_value < best_value - 1e-9 * np.maximum(1, np.abs(best_value))
+         policy = np.where(improved, best_action, policy)
+
+         q_table[on_track] = new_q
+         policy_table[on_track] = policy if self.policy_index else actions[policy]
+
+         # Convergence criteria
+         if not improved.any():
+            converged = True
+
+         self.num_train_iter += 1
+         past_value_difference.append(delta)
+         Profiler.count("policy_evaluations")
+         Profiler.count("backups", len(on_track))
+         self.checkpoint(checkpoint_path, checkpoint_every, past_value_difference, converged)
+      return past_value_difference, self.num_train_iter
+
+   @Profiler.timed("policy_evaluation")
+   def evaluate_policy(self, policy, next_row, finished, reward, discount, solver = "direct", initial_values = None):
+      """Computes the exact values of a policy by solving (I - discount * P) V = r
+
+      Args:
+         policy (array): the action index taken in each row
+         next_row (matrix): the row reached by taking each action in each row
+         finished (matrix): whether taking each action in each row finishes the race
+         reward (matrix): the reward of taking each action in each row
+         discount (float): the amount of discount to be applied
+         solver (string): "direct" or "iterative"
+         initial_values (array): the starting guess of the iterative solver
+
+      Returns:
+         the value of each row under the policy
+      """
+      n_rows = len(policy)
+      rows = np.arange(n_rows)
+      target = next_row[rows, policy]
+      moves = ~finished[rows, policy]
+
+      # The car stays put with probability 0.2 and moves with probability 0.8, unless the move finishes the race
+      system = scipy.sparse.csr_matrix(
+         (np.concatenate((np.full(n_rows, 1 - .2 * discount), np.full(moves.sum(), -.8 * discount))),
+          (np.concatenate((rows, rows[moves])), np.concatenate((rows, target[moves])))),
+         shape=(n_rows, n_rows))
+      rewards = reward[rows, policy]
+      if solver == "direct":
+         return scipy.sparse.linalg.spsolve(system.tocsc(), rewards)
+      values, info = scipy.sparse.linalg.bicgstab(system, rewards, x0=initial_values, rtol=1e-10, atol=0)
+      if info != 0:
+         return scipy.sparse.linalg.spsolve(system.tocsc(), rewards)
+      return values
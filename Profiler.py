@@ -0,0 +1,101 @@
+import functools
+import time
+
+# Profiling is opt-in, every hook checks this flag first so a disabled profiler only costs an attribute lookup
+enabled = False
+timings = {}
+calls = {}
+counts = {}
+
+def enable():
+   """Starts recording timings and counters"""
+   global enabled
+   enabled = True
+
+def disable():
+   """Stops recording timings and counters, keeping what was recorded so far"""
+   global enabled
+   enabled = False
+
+def reset():
+   """Forgets every recorded timing and counter"""
+   timings.clear()
+   calls.clear()
+   counts.clear()
+
+def count(name, n = 1):
+   """Adds to a counter
+
+   Args:
+      name (string): the name of the counter, such as "steps" or "crash_checks"
+      n (int): the amount to add
+   """
+   if enabled:
+      counts[name] = counts.get(name, 0) + n
+
+class phase:
+   def __init__(self, name):
+      """Times a phase of work as a context manager, accumulating over every time the phase runs
+
+      Args:
+         name (string): the name of the phase, such as "train" or "ray_casts"
+      """
+      self.name = name
+      self.start = None
+
+   def __enter__(self):
+      if enabled:
+         self.start = time.perf_counter()
+      return self
+
+   def __exit__(self, *exc_info):
+      if self.start is not None:
+         timings[self.name] = timings.get(self.name, 0.0) + time.perf_counter() - self.start
+         calls[self.name] = calls.get(self.name, 0) + 1
+         self.start = None
+      return False
+
+def timed(name):
+   """Decorates a function so that every call to it is timed as a phase
+
+   Args:
+      name (string): the name of the phase
+
+   Returns:
+      the decorator
+   """
+   def decorator(function):
+      @functools.wraps(function)
+      def wrapper(*args, **kwargs):
+         if not enabled:
+            return function(*args, **kwargs)
+         with phase(name):
+            return function(*args, **kwargs)
+      return wrapper
+   return decorator
+
+def summary():
+   """Summarizes everything recorded since the last reset
+
+   Returns:
+      a JSON serializable dictionary with the total seconds and number of calls of each phase, and each counter.
+      Phases are timed inclusively, so a phase run from inside another counts towards both
+   """
+   return {
+      "timings": {name: {"seconds": seconds, "calls": calls[name]} for name, seconds in sorted(timings.items())},
+      "counts": dict(sorted(counts.items())),
+   }
+
+def report():
+   """Formats the summary as a table, slowest phase first
+
+   Returns:
+      the table as a string
+   """
+   lines = ["{:<24}{:>12}{:>10}".format("phase", "seconds", "calls")]
+   for name, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+      lines.append("{:<24}{:>12.4f}{:>10}".format(name, seconds, calls[name]))
+   lines.append("{:<24}{:>22}".format("counter", "count"))
+   for name, n in sorted(counts.items()):
+      lines.append("{:<24}{:>22}".format(name, n))
+   return "\n".join(lines)
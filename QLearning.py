@@ -1,24 +1,39 @@
 import numpy as np
 from Racetrack import Racetrack
-from Car import Car
-import random
-import Helpers
+from StateCodec import StateCodec
+from ActionSelector import ActionSelector
+from ReplayBuffer import ReplayBuffer, LearnedModel
+import Checkpoint
+import Evaluation
+import Profiler
 
 # --------- Q-Learning ---------
 class QLearning:
-   def __init__(self, filename):
+   def __init__(self, filename, compact = False, dtype = np.float64):
       """ Initializes the class
       Args:
          filename (string): the name of the file containing the Racetrack
+         compact (bool): whether to only store the states reachable from the start line, as flat tables
+         dtype (type): the float type of the q table, such as np.float32 or np.float16
       """
+      self.filename = filename
+      self.options = {"compact": compact, "dtype": np.dtype(dtype).name}
       self.track = Racetrack(filename)
 
-      self.n_states = (len(self.track.track), len(self.track.track[0]), 11, 11)
+      self.codec = StateCodec(*self.track.grid.shape)
+      self.compact = compact
+      # Tables are flat, one row per state code, or per compact index when compact
+      self.n_states = self.track.state_indexer().n_states if compact else self.codec.n_states
+      self.table_shape = (self.n_states,)
       self.actions = [[-1, -1], [-1, 0], [0, -1], [0, 0], [0, 1], [1, 0], [1, 1], [-1, 1], [1, -1]]
-      self.q_table = np.zeros((self.n_states[0], self.n_states[1], self.n_states[2], self.n_states[3], len(self.actions)))
+      self.q_table = np.zeros(self.table_shape + (len(self.actions),), dtype=dtype)
    
-   def train(self, discount = .9, epsilon = .4, decay = .99, learning_rate = .8, num_iter = 1000, crash_type = 0):
+   @Profiler.timed("QLearning.train")
+   def train(self, discount = .9, epsilon = .4, decay = .99, learning_rate = .8, num_iter = 1000, crash_type = 0, checkpoint_path = None, checkpoint_every = None, resume = False, seed = None, replay_capacity = None, replay_batch = 32, planning_steps = 0, stopping = None):
       """Trains Q-Learning
+      Optionally replays a batch of stored transitions after every step, and with planning_steps > 0 runs Dyna-Q,
+      replaying that many transitions simulated from a model learned from the real steps.
+      Both update the action that was carried out, and neither is checkpointed, so a resumed run starts them empty
       
       Args:
          discount (float): the discount factor to be applied
@@ -27,105 +42,202 @@ class QLearning:
          learning_rate(float): how fast the algorithm should learn
          num_iter (int): the number of episodes/iterations to take
          crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+         checkpoint_path (string): the directory to save checkpoints to and resume from
+         checkpoint_every (int): the number of episodes between checkpoints, None to never checkpoint
+         resume (bool): whether to continue from the checkpoint in checkpoint_path, if there is one
+         seed (int): the seed of the action selector's random generator, None for fresh entropy
+         replay_capacity (int): the number of transitions the replay buffer keeps, None to not replay
+         replay_batch (int): the number of stored transitions replayed after every step
+         planning_steps (int): the number of Dyna-Q planning updates after every step, 0 to not plan
+         stopping (QDelta, EpisodeLength, GreedyEvaluation or AnyOf): a Convergence criterion that can end training early, None to run every episode
       
       Returns:
          self.num_train_iter (array): the number of iterations of each episode it took to reach the finish line
       """
+      self.hyperparameters = {"discount": discount, "epsilon": epsilon, "decay": decay, "learning_rate": learning_rate, "num_iter": num_iter, "crash_type": crash_type, "seed": seed}
+      if replay_capacity is not None or planning_steps:
+         self.hyperparameters.update({"replay_capacity": replay_capacity, "replay_batch": replay_batch, "planning_steps": planning_steps})
+      model = self.track.transition_model(crash_type, self.compact)
+      selector = ActionSelector(len(self.actions), seed)
       self.num_train_iter = []
-      #sas = []
-      for i in range(num_iter):
-         start_pos = random.choice(self.track.start_line)
-         car = Car(start_pos[0], start_pos[1])
+      first_episode = 0
+
+      # Pick up where the last checkpoint left off
+      metadata = Checkpoint.read_metadata(checkpoint_path) if resume else None
+      if metadata is not None and metadata["training_state"] is not None:
+         Checkpoint.load_tables(self, checkpoint_path)
+         training_state = metadata["training_state"]
+         first_episode = training_state["episode"]
+         epsilon = training_state["epsilon"]
+         learning_rate = training_state["learning_rate"]
+         selector.set_state(training_state["random_state"])
+
+      q_table = self.q_table
+      # Replay draws from its own generator, so the selector's draws and checkpoints are the same with or without it
+      replay = ReplayBuffer(replay_capacity) if replay_capacity is not None else None
+      learned = LearnedModel(len(q_table), len(self.actions)) if planning_steps else None
+      replay_rng = np.random.default_rng(None if seed is None else [seed, 1])
+      self.stop_episode = None
+      if stopping is not None:
+         stopping.reset()
+      for i in range(first_episode, num_iter):
+         start_pos = self.track.start_line[selector.integer(len(self.track.start_line))]
+         state = model.encode(start_pos[0], start_pos[1], 0, 0)
 
          step = 0
+         q_delta = 0
          finished = False
          while not finished:
             reward = -1
-            old_position = [car.y, car.x]
-            q_vals = self.q_table[car.y][car.x][car.vy + 5][car.vx + 5]
-            #s1 = (car.y, car.x, car.vy, car.vx)
-            index = Helpers.epsilon_greedy(q_vals, epsilon)
+            q_vals = q_table[state]
+            previous = state
+            index = selector.select(q_vals, epsilon)
 
             q_val = q_vals[3]
-            action = [0, 0]
+            action_index = 3
 
             # Nondeterministic Step
-            if random.random() <= .8:
+            if selector.chance(.8):
                q_val = q_vals[index]
-               action = self.actions[index]
-            #a = (action[0], action[1])
-            
-            car.step(action[0], action[1])
-            #s2 = (car.y, car.x, car.vy, car.vx)
+               action_index = index
 
             # Adjust reward if we crash or finish
-            finished = Helpers.crossed_finish([old_position[0], old_position[1]], [car.y, car.x], self.track)
-            crash = Helpers.did_crash([old_position[0], old_position[1]], [car.y, car.x], self.track)
-            if crash[0] != None:
+            finished = model.finished[state, action_index]
+            if model.crashed[state, action_index]:
                reward = -10
-               if crash_type:
-                  car.crash_reset(Helpers.get_nearest_start(self.track, crash))
-               else:
-                  car.crash_reset(crash)
             if finished:
                reward = 0
+            state = model.next_state[state, action_index]
 
             # Update q-table values
-            q_values_prime = self.q_table[car.y][car.x][car.vy + 5][car.vx + 5]
+            q_values_prime = q_table[state]
             max_q_value_prime = np.max(q_values_prime)
-            q_vals[index] += learning_rate * (reward + discount * max_q_value_prime - q_val)
+            update = learning_rate * (reward + discount * max_q_value_prime - q_val)
+            q_vals[index] += update
+            q_delta = max(q_delta, abs(update))
+
+            if replay is not None:
+               replay.add(previous, action_index, reward, state, finished)
+               self.replay_update(q_table, replay.sample(replay_batch, replay_rng), discount, learning_rate)
+            if learned is not None:
+               learned.add(previous, action_index, reward, state, finished)
+               self.replay_update(q_table, learned.sample(planning_steps, replay_rng), discount, learning_rate)
 
             step += 1
-            #sas.append([s1, a, s2])
          # Handle decay
          epsilon *= decay
          if learning_rate > 0.01:
             learning_rate *= decay
 
          self.num_train_iter.append(step)
+         Profiler.count("episodes")
+         Profiler.count("steps", step)
+
+         if checkpoint_every and (i + 1) % checkpoint_every == 0:
+            training_state = {"episode": i + 1, "epsilon": epsilon, "learning_rate": learning_rate, "random_state": selector.get_state()}
+            Checkpoint.save(self, checkpoint_path, ["q_table"], training_state)
+
+         if stopping is not None and stopping.update(self, model, i, step, q_delta, bool(finished)):
+            self.stop_episode = i + 1
+            break
       return self.num_train_iter
 
-   def test(self, crash_type = 0):
+   def replay_update(self, q_table, transitions, discount, learning_rate):
+      """Applies the Q-Learning update to a batch of transitions at once
+      Every target is computed from the table before the batch, and a pair drawn twice is only updated once
+
+      Args:
+         q_table (matrix): the flat q table, one row per state
+         transitions (tuple): the (states, actions, rewards, next_states, done) arrays of the transitions
+         discount (float): the discount factor to be applied
+         learning_rate (float): how fast the algorithm should learn
+      """
+      states, actions, rewards, next_states, done = transitions
+      max_q_value_prime = np.where(done, 0, q_table[next_states].max(axis=1))
+      q_table[states, actions] += learning_rate * (rewards + discount * max_q_value_prime - q_table[states, actions])
+
+   def save(self, path):
+      """Saves the q table with its metadata
+
+      Args:
+         path (string): the directory to write to
+      """
+      Checkpoint.save(self, path, ["q_table"])
+
+   @classmethod
+   def load(cls, path, mmap_mode = None, filename = None):
+      """Loads a saved model
+
+      Args:
+         path (string): the directory the model was saved to
+         mmap_mode (string): None to read the table into memory, or a numpy memory map mode such as "r"
+            to share one saved table read-only between processes without copying it
+         filename (string): the racetrack file, if it has moved since the model was saved
+
+      Returns:
+         the loaded model
+      """
+      return Checkpoint.load(cls, path, mmap_mode, filename)
+
+   def greedy_policy(self):
+      """Finds the greedy action in every state
+
+      Returns:
+         the index of the action with the largest q-value in each state of the flat q table
+      """
+      return self.q_table.argmax(axis=1)
+
+   def evaluate(self, n_rollouts = 1000, seed = None, crash_type = 0, exact = False):
+      """Runs many noisy rollouts of the greedy policy at once
+
+      Args:
+         n_rollouts (int): the number of rollouts to run
+         seed (int): the seed of the random generator
+         crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+         exact (bool): whether to also compute the exact expected number of steps from each starting point
+
+      Returns:
+         the summary statistics of Evaluation.evaluate
+      """
+      model = self.track.transition_model(crash_type, self.compact)
+      return Evaluation.evaluate(model, self.greedy_policy(), n_rollouts, seed, exact=exact)
+
+   @Profiler.timed("QLearning.test")
+   def test(self, crash_type = 0, seed = None):
       """Runs a car from the start to the finish
       
       Args:
          crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+         seed (int): the seed of the action selector's random generator, None for fresh entropy
          
       Returns:
          self.num_test_iter (int): the number of steps required to get to the finish
          steps (array): the list of steps taken
       """
-      start_pos = random.choice(self.track.start_line)
-      car = Car(start_pos[0], start_pos[1])
+      model = self.track.transition_model(crash_type, self.compact)
+      q_table = self.q_table
+      selector = ActionSelector(len(self.actions), seed)
+      start_pos = self.track.start_line[selector.integer(len(self.track.start_line))]
+      state = model.encode(start_pos[0], start_pos[1], 0, 0)
 
       self.num_test_iter = 0
       finished = False
       steps = [start_pos]
-      epsilon = 0
 
       while not finished and self.num_test_iter < 1000:
-         old_position = [car.y, car.x]
-
-         q_vals = self.q_table[car.y][car.x][car.vy + 5][car.vx + 5]
-
-         index = Helpers.epsilon_greedy(q_vals, epsilon)
-         action = self.actions[index]
+         index = int(q_table[state].argmax())
          
          self.num_test_iter += 1
 
          # Nondeterministic Step
-         if random.random() <= .8:
-            car.step(action[0], action[1])
-         else:
-            car.step(0, 0)
+         action_index = 3
+         if selector.chance(.8):
+            action_index = index
 
          # Check if we crashed or finished
-         finished = Helpers.crossed_finish([old_position[0], old_position[1]], [car.y, car.x], self.track)
-         crash = Helpers.did_crash([old_position[0], old_position[1]], [car.y, car.x], self.track)
-         if crash[0] != None:
-            if crash_type:
-               car.crash_reset(Helpers.get_nearest_start(self.track, crash))
-            else:
-               car.crash_reset(crash)
-         steps.append([car.y, car.x])
+         finished = model.finished[state, action_index]
+         state = model.next_state[state, action_index]
+         y, x, vy, vx = model.decode(state)
+         steps.append([y, x])
+      Profiler.count("test_steps", len(steps) - 1)
       return self.num_test_iter, steps
\ No newline at end of file
@@ -1,31 +1,79 @@
 import numpy as np
+import scipy.ndimage
+from TransitionModel import TransitionModel
+from CollisionCache import CollisionCache
+from StateIndexer import StateIndexer
+# The cell types live in a module of their own, so Helpers and TransitionModel can use them without importing Racetrack
+from Cells import WALL, START, FINISH, CELL_TYPES, CHARACTERS
+
+# Attributes built from the grid on first use
+POINT_LISTS = {"start_line": START, "finish_line": FINISH, "wall": WALL}
+POINT_SETS = {"start_set": "start_line", "finish_set": "finish_line", "wall_set": "wall"}
+
 class Racetrack:
    def __init__(self, filename):
       """Initializes a race track
+      Text tracks are read in one go, binary tracks written by TrackGenerator.save_grid are memory mapped.
+      The track, start_line, finish_line and wall lists, the coordinate sets and the nearest_start reset map are only built when first used
       
       Args:
-         filename (string): the name of the file containing the racetrack
+         filename (string): the name of the file containing the racetrack, as text or as a .npy grid
       """
-      file = open(filename, "r")
-      file.readline()
-      
-      self.track = []
-      self.start_line = []
-      self.finish_line = []
-      self.wall = []
-      i = 0
-      for line in file:
-         line = line.strip()
-         self.track.append(line)
-         for j in range(len(line)):
-            if line[j] == "S":
-               self.start_line.append([i, j])
-            elif line[j] == "F":
-               self.finish_line.append([i, j])
-            elif line[j] == "#":
-               self.wall.append([i, j])
-         i += 1
-      file.close()
+      if filename.endswith(".npy"):
+         self.grid = np.load(filename, mmap_mode="r")
+      else:
+         with open(filename, "r") as file:
+            file.readline()
+            lines = [line.strip() for line in file.read().splitlines()]
+         while lines and not lines[-1]:
+            lines.pop()
+         if any(len(line) != len(lines[0]) for line in lines):
+            raise ValueError(filename + " is not rectangular")
+         # Occupancy grid, one byte per cell
+         characters = np.frombuffer("".join(lines).encode("latin-1"), dtype=np.uint8).reshape(len(lines), -1)
+         self.grid = CELL_TYPES[characters]
+         self.track = lines
+
+      self.transition_models = {}
+      self.compact_models = {}
+      self.indexer = None
+      self.collision_cache = None
+
+   def __getattr__(self, name):
+      """Builds the track strings, point lists and point sets from the grid on first use
+      They are stored as plain attributes afterwards, so later lookups don't come back here
+
+      Args:
+         name (string): the name of the missing attribute
+
+      Returns:
+         the built attribute
+      """
+      if name == "track":
+         value = [row.tobytes().decode("latin-1") for row in CHARACTERS[np.asarray(self.grid)]]
+      elif name in POINT_LISTS:
+         value = np.argwhere(np.asarray(self.grid) == POINT_LISTS[name]).tolist()
+      elif name in POINT_SETS:
+         value = set(map(tuple, getattr(self, POINT_SETS[name])))
+      elif name == "nearest_start":
+         value = self.build_nearest_start()
+      else:
+         raise AttributeError(name)
+      setattr(self, name, value)
+      return value
+
+   def build_nearest_start(self):
+      """Finds the starting point nearest to every cell of the track, by Euclidean distance
+      Used as the reset map of hard crashes, nearest_start[y][x] is the [y, x] a car crashing at (y, x) restarts from
+
+      Returns:
+         the reset map, of shape (rows, cols, 2)
+      """
+      start = np.asarray(self.grid) == START
+      if not start.any():
+         raise ValueError("The track has no starting points")
+      indices = scipy.ndimage.distance_transform_edt(~start, return_distances=False, return_indices=True)
+      return np.ascontiguousarray(np.moveaxis(indices, 0, -1), dtype=np.int64)
 
    def print_track(self):
       """Prints a string representation of the track"""
@@ -35,4 +83,52 @@ class Racetrack:
             track_string += self.track[y][x]
          track_string += "\n"
 
-      print(track_string)
\ No newline at end of file
+      print(track_string)
+
+   def enable_collision_cache(self, maxsize = None, precompute = False):
+      """Memoizes the outcome of moves on this track for Helpers and the transition models
+
+      Args:
+         maxsize (int): the number of entries to keep in least recently used order, or None to keep every entry
+         precompute (bool): whether to fill the cache for every cell and displacement up front
+
+      Returns:
+         the CollisionCache of the track
+      """
+      if self.collision_cache is None or self.collision_cache.maxsize != maxsize:
+         self.collision_cache = CollisionCache(self, maxsize)
+      if precompute and not self.collision_cache.complete:
+         self.collision_cache.precompute()
+      return self.collision_cache
+
+   def disable_collision_cache(self):
+      """Stops memoizing the outcome of moves on this track"""
+      self.collision_cache = None
+
+   def transition_model(self, crash_type = 0, compact = False):
+      """Gets the transition model of the track, building it on first use
+
+      Args:
+         crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+         compact (bool): whether to restrict the model to the states reachable from the start line
+
+      Returns:
+         the TransitionModel for the given crash type
+      """
+      if compact:
+         if crash_type not in self.compact_models:
+            self.compact_models[crash_type] = self.state_indexer().compact(crash_type)
+         return self.compact_models[crash_type]
+      if crash_type not in self.transition_models:
+         self.transition_models[crash_type] = TransitionModel(self, crash_type)
+      return self.transition_models[crash_type]
+
+   def state_indexer(self):
+      """Gets the indexer of the states reachable from the start line, building it on first use
+
+      Returns:
+         the StateIndexer of the track
+      """
+      if self.indexer is None:
+         self.indexer = StateIndexer(self)
+      return self.indexer
\ No newline at end of file
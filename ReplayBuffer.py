@@ -0,0 +1,106 @@
+import numpy as np
+
+class ReplayBuffer:
+   def __init__(self, capacity = 100000):
+      """Initializes a ring buffer of transitions, backed by preallocated arrays
+      Once full, every new transition overwrites the oldest one
+
+      Args:
+         capacity (int): the number of transitions to keep
+      """
+      self.capacity = capacity
+      self.states = np.zeros(capacity, dtype=np.int64)
+      self.actions = np.zeros(capacity, dtype=np.int8)
+      self.rewards = np.zeros(capacity, dtype=np.int16)
+      self.next_states = np.zeros(capacity, dtype=np.int64)
+      self.done = np.zeros(capacity, dtype=bool)
+      self.position = 0
+      self.size = 0
+
+   def __len__(self):
+      return self.size
+
+   def add(self, state, action, reward, next_state, done):
+      """Stores a transition
+
+      Args:
+         state (int): the flat index of the state the action was taken in
+         action (int): the index of the action that was carried out
+         reward (int): the reward received
+         next_state (int): the flat index of the state reached
+         done (bool): whether the transition finished the race
+      """
+      position = self.position
+      self.states[position] = state
+      self.actions[position] = action
+      self.rewards[position] = reward
+      self.next_states[position] = next_state
+      self.done[position] = done
+      self.position = (position + 1) % self.capacity
+      self.size = min(self.size + 1, self.capacity)
+
+   def sample(self, batch_size, rng):
+      """Draws stored transitions uniformly at random, with replacement
+
+      Args:
+         batch_size (int): the number of transitions to draw
+         rng (Generator): the NumPy random generator to draw with
+
+      Returns:
+         the (states, actions, rewards, next_states, done) arrays of the transitions
+      """
+      index = rng.integers(self.size, size=batch_size)
+      return self.states[index], self.actions[index], self.rewards[index], self.next_states[index], self.done[index]
+
+class LearnedModel:
+   def __init__(self, n_states, n_actions):
+      """Initializes the model of Dyna-Q, which remembers the outcome of every (state, action) pair seen so far
+      The racetrack is deterministic once the carried out action is known, so one outcome per pair is enough
+
+      Args:
+         n_states (int): the number of states
+         n_actions (int): the number of actions
+      """
+      self.n_actions = n_actions
+      self.next_states = np.full(n_states * n_actions, -1, dtype=np.int64)
+      self.rewards = np.zeros(n_states * n_actions, dtype=np.int16)
+      self.done = np.zeros(n_states * n_actions, dtype=bool)
+      # The flat (state, action) indices seen so far, grown by doubling
+      self.pairs = np.zeros(1024, dtype=np.int64)
+      self.size = 0
+
+   def __len__(self):
+      return self.size
+
+   def add(self, state, action, reward, next_state, done):
+      """Remembers the outcome of a (state, action) pair
+
+      Args:
+         state (int): the flat index of the state the action was taken in
+         action (int): the index of the action that was carried out
+         reward (int): the reward received
+         next_state (int): the flat index of the state reached
+         done (bool): whether the transition finished the race
+      """
+      pair = state * self.n_actions + action
+      if self.next_states[pair] < 0:
+         if self.size == len(self.pairs):
+            self.pairs = np.concatenate((self.pairs, np.zeros(len(self.pairs), dtype=np.int64)))
+         self.pairs[self.size] = pair
+         self.size += 1
+      self.next_states[pair] = next_state
+      self.rewards[pair] = reward
+      self.done[pair] = done
+
+   def sample(self, n, rng):
+      """Simulates remembered (state, action) pairs drawn uniformly at random
+
+      Args:
+         n (int): the number of pairs to simulate
+         rng (Generator): the NumPy random generator to draw with
+
+      Returns:
+         the (states, actions, rewards, next_states, done) arrays of the simulated transitions
+      """
+      pairs = self.pairs[rng.integers(self.size, size=n)]
+      return pairs // self.n_actions, pairs % self.n_actions, self.rewards[pairs], self.next_states[pairs], self.done[pairs]
@@ -0,0 +1,130 @@
+import csv
+import hashlib
+import os
+import numpy as np
+import Sweep
+
+class ResultsWriter:
+   def __init__(self, directory, header, key_columns, array_columns):
+      """Initializes a results store that trials are appended to as they finish
+      Scalar columns are streamed to directory/summary.csv, one row per trial. Array columns, such as per-episode
+      step counts, are written to one uncompressed .npz shard per trial in directory/arrays.
+      Has the same interface as Sweep.CsvWriter, so a partially completed sweep can be resumed
+
+      Args:
+         directory (string): the directory to write to
+         header (array): the names of the columns of a result row
+         key_columns (array): the header columns that identify a trial, taken from its spec
+         array_columns (array): the header columns holding a list or array per trial
+      """
+      self.directory = directory
+      self.header = header
+      self.array_columns = array_columns
+      self.scalar_columns = [column for column in header if column not in array_columns]
+      os.makedirs(os.path.join(directory, "arrays"), exist_ok=True)
+      self.summary = Sweep.CsvWriter(os.path.join(directory, "summary.csv"), ["trial"] + self.scalar_columns, key_columns)
+
+   def trial_id(self, spec):
+      """Names the shard of a trial after its key
+
+      Args:
+         spec (dict): the hyperparameters of the trial
+
+      Returns:
+         the id of the trial
+      """
+      return hashlib.sha1(repr(self.summary.key(spec)).encode("UTF8")).hexdigest()[:16]
+
+   def completed(self, spec):
+      """Determines whether a trial has already been written
+
+      Args:
+         spec (dict): the hyperparameters of the trial
+
+      Returns:
+         True if the trial is already on disk, False otherwise
+      """
+      return self.summary.completed(spec)
+
+   def write(self, spec, row):
+      """Appends the row of a finished trial
+      The shard is written first, so a trial only counts as completed once all of its data is on disk
+
+      Args:
+         spec (dict): the hyperparameters of the trial
+         row (array): the result row of the trial, in header order
+      """
+      trial = self.trial_id(spec)
+      values = dict(zip(self.header, row))
+      shard = os.path.join(self.directory, "arrays", trial)
+      np.savez(shard + ".tmp.npz", **{column: np.asarray(values[column]) for column in self.array_columns})
+      os.replace(shard + ".tmp.npz", shard + ".npz")
+      self.summary.write(spec, [trial] + [values[column] for column in self.scalar_columns])
+
+class ResultsReader:
+   def __init__(self, directory):
+      """Initializes a reader of a results store written by ResultsWriter
+
+      Args:
+         directory (string): the directory the results were written to
+      """
+      self.directory = directory
+      with open(os.path.join(directory, "summary.csv"), "r", newline="", encoding="UTF8") as f:
+         rows = list(csv.reader(f))
+      self.header = rows[0]
+      self.rows = rows[1:]
+      self.trials = [row[0] for row in self.rows]
+
+   def scalars(self, columns = None, trials = None):
+      """Reads scalar columns
+
+      Args:
+         columns (array): the columns to read, None for every scalar column
+         trials (array): the ids of the trials to read, None for every trial
+
+      Returns:
+         a dictionary of column name to NumPy array, with ints and floats parsed where every value allows it
+      """
+      rows = self.rows
+      if trials is not None:
+         trials = set(trials)
+         rows = [row for row in rows if row[0] in trials]
+
+      table = {}
+      for column in columns or self.header:
+         values = [row[self.header.index(column)] for row in rows]
+         for dtype in [np.int64, np.float64]:
+            try:
+               table[column] = np.array(values, dtype=dtype)
+               break
+            except ValueError:
+               pass
+         else:
+            table[column] = np.array(values)
+      return table
+
+   def array(self, trial, column):
+      """Reads one array column of one trial, without reading its other columns
+
+      Args:
+         trial (string): the id of the trial
+         column (string): the array column to read
+
+      Returns:
+         the array
+      """
+      with np.load(os.path.join(self.directory, "arrays", trial + ".npz")) as shard:
+         return shard[column]
+
+   def arrays(self, column, trials = None):
+      """Lazily reads one array column of many trials
+
+      Args:
+         column (string): the array column to read
+         trials (array): the ids of the trials to read, None for every trial
+
+      Returns:
+         a generator of (trial, array) pairs
+      """
+      for trial in self.trials if trials is None else trials:
+         yield trial, self.array(trial, column)
@@ -1,22 +1,33 @@
 import numpy as np
 from Racetrack import Racetrack
-from Car import Car
-import random
-import Helpers
+from StateCodec import StateCodec
+from ActionSelector import ActionSelector
+import Checkpoint
+import Evaluation
+import Profiler
 
 class SARSA:
-   def __init__(self, filename):
+   def __init__(self, filename, compact = False, dtype = np.float64):
       """ Initializes the class
       Args:
          filename (string): the name of the file containing the Racetrack
+         compact (bool): whether to only store the states reachable from the start line, as flat tables
+         dtype (type): the float type of the q table, such as np.float32 or np.float16
       """
+      self.filename = filename
+      self.options = {"compact": compact, "dtype": np.dtype(dtype).name}
       self.track = Racetrack(filename)
 
-      self.n_states = (len(self.track.track), len(self.track.track[0]), 11, 11)
+      self.codec = StateCodec(*self.track.grid.shape)
+      self.compact = compact
+      # Tables are flat, one row per state code, or per compact index when compact
+      self.n_states = self.track.state_indexer().n_states if compact else self.codec.n_states
+      self.table_shape = (self.n_states,)
       self.actions = [[-1, -1], [-1, 0], [0, -1], [0, 0], [0, 1], [1, 0], [1, 1], [-1, 1], [1, -1]]
-      self.q_table = np.random.rand(self.n_states[0], self.n_states[1], self.n_states[2], self.n_states[3], len(self.actions))
+      self.q_table = np.random.rand(*self.table_shape, len(self.actions)).astype(dtype)
 
-   def train(self, num_episodes = 10000, iter_per_episode = 100, discount = .9, epsilon = .1, decay = .99, learning_rate = .1, crash_type = 0):
+   @Profiler.timed("SARSA.train")
+   def train(self, num_episodes = 10000, iter_per_episode = 100, discount = .9, epsilon = .1, decay = .99, learning_rate = .1, crash_type = 0, checkpoint_path = None, checkpoint_every = None, resume = False, seed = None, stopping = None):
       """Trains Q-Learning
       
       Args:
@@ -27,121 +38,177 @@ class SARSA:
          decay (float): the amount of decay to apply
          learning_rate(float): how fast the algorithm should learn
          crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+         checkpoint_path (string): the directory to save checkpoints to and resume from
+         checkpoint_every (int): the number of episodes between checkpoints, None to never checkpoint
+         resume (bool): whether to continue from the checkpoint in checkpoint_path, if there is one
+         seed (int): the seed of the action selector's random generator, None for fresh entropy
+         stopping (QDelta, EpisodeLength, GreedyEvaluation or AnyOf): a Convergence criterion that can end training early, None to run every episode
       
       Returns:
-         num_episodes * iter_per_episode: the total number of steps taken in the training
+         episodes * iter_per_episode: the total number of steps budgeted for the episodes run
          episode_rewards (array): the cumulative reward from each episode
       """
-      start_pos = random.choice(self.track.start_line)
-      car = Car(start_pos[0], start_pos[1])
+      self.hyperparameters = {"num_episodes": num_episodes, "iter_per_episode": iter_per_episode, "discount": discount, "epsilon": epsilon, "decay": decay, "learning_rate": learning_rate, "crash_type": crash_type, "seed": seed}
+      model = self.track.transition_model(crash_type, self.compact)
+      selector = ActionSelector(len(self.actions), seed)
 
       reward = -1
       episode_rewards = []
+      first_episode = 0
+
+      # Pick up where the last checkpoint left off
+      metadata = Checkpoint.read_metadata(checkpoint_path) if resume else None
+      if metadata is not None and metadata["training_state"] is not None:
+         Checkpoint.load_tables(self, checkpoint_path)
+         training_state = metadata["training_state"]
+         first_episode = training_state["episode"]
+         episode_rewards = training_state["episode_rewards"]
+         selector.set_state(training_state["random_state"])
+
+      q_table = self.q_table
+      self.stop_episode = None
+      if stopping is not None:
+         stopping.reset()
       # Iterate through all episodes
-      for episode in range(num_episodes):
-         for point in self.track.finish_line:
-            self.q_table[point[0]][point[1]][:][:][:] = 0
+      for episode in range(first_episode, num_episodes):
+         q_table[model.finish] = 0
          
          # Get initial state
-         start_pos = random.choice(self.track.start_line)
+         start_pos = self.track.start_line[selector.integer(len(self.track.start_line))]
          y = start_pos[0]
          x = start_pos[1]
          vy = 0
          vx = 0
 
          # Get action, epsilon greedy
-         index = Helpers.epsilon_greedy(self.q_table[y][x][vy][vx], epsilon)
-         action = self.actions[index]
-         
-         # Instantiate car
-         car.y = y
-         car.x = x
-         car.vx = vx
-         car.vy = vy
+         state = model.encode(y, x, vy, vx)
+         index = selector.select(q_table[state], epsilon)
 
          episode_reward = 0
+         episode_steps = 0
+         q_delta = 0
 
          # Iterate through episode iterations
          for i in range(iter_per_episode):
             # If we are in the wall of finished, do not consider
-            if self.track.track[y][x] == "F" or self.track.track[y][x] == "#":
+            if model.finish[state] or model.wall[state]:
                break
-            old_position = [y, x]
 
             # Nondeterministic step
-            if random.random() <= .8:
-               car.step(action[0], action[1])
-            else:
-               car.step(0, 0)
-
-            # Check whether we crashed or finished
-            finished = Helpers.crossed_finish([old_position[0], old_position[1]], [car.y, car.x], self.track)
-            crash = Helpers.did_crash([old_position[0], old_position[1]], [car.y, car.x], self.track)
-            
-            # Handle crash
-            if crash[0] != None:
-               if crash_type:
-                  car.crash_reset(Helpers.get_nearest_start(self.track, crash))
-               else:
-                  car.crash_reset(crash)
+            action_index = 3
+            if selector.chance(.8):
+               action_index = index
+
+            # Look up where we end up after any crash
+            state_prime = model.next_state[state, action_index]
 
             # Get next action
-            index_prime = Helpers.epsilon_greedy(self.q_table[car.y][car.x][car.vy + 5][car.vx + 5], epsilon)
+            index_prime = selector.select(q_table[state_prime], epsilon)
             
             # Update Q-table
-            self.q_table[y][x][vy + 5][vx + 5][index] += learning_rate * (reward + decay * self.q_table[car.y][car.x][car.vy + 5][car.vx + 5][index_prime] - self.q_table[y][x][vy + 5][vx + 5][index])
+            update = learning_rate * (reward + decay * q_table[state_prime, index_prime] - q_table[state, index])
+            q_table[state, index] += update
+            q_delta = max(q_delta, abs(update))
             
             # Set original state, s, to our new state, s`
-            y = car.y
-            x = car.x
-            vy = car.vy
-            vx = car.vx
+            state = state_prime
             index = index_prime
-            action = self.actions[index_prime]
 
             episode_reward += reward
+            episode_steps += 1
          episode_rewards.append(episode_reward)
-      return num_episodes * iter_per_episode, episode_rewards
+         Profiler.count("episodes")
+         Profiler.count("steps", episode_steps)
+
+         if checkpoint_every and (episode + 1) % checkpoint_every == 0:
+            training_state = {"episode": episode + 1, "episode_rewards": episode_rewards, "random_state": selector.get_state()}
+            Checkpoint.save(self, checkpoint_path, ["q_table"], training_state)
+
+         if stopping is not None and stopping.update(self, model, episode, episode_steps, q_delta, bool(model.finish[state])):
+            self.stop_episode = episode + 1
+            break
+      return (self.stop_episode or num_episodes) * iter_per_episode, episode_rewards
       
+   def save(self, path):
+      """Saves the q table with its metadata
+
+      Args:
+         path (string): the directory to write to
+      """
+      Checkpoint.save(self, path, ["q_table"])
+
+   @classmethod
+   def load(cls, path, mmap_mode = None, filename = None):
+      """Loads a saved model
+
+      Args:
+         path (string): the directory the model was saved to
+         mmap_mode (string): None to read the table into memory, or a numpy memory map mode such as "r"
+            to share one saved table read-only between processes without copying it
+         filename (string): the racetrack file, if it has moved since the model was saved
+
+      Returns:
+         the loaded model
+      """
+      return Checkpoint.load(cls, path, mmap_mode, filename)
+
+   def greedy_policy(self):
+      """Finds the greedy action in every state
+
+      Returns:
+         the index of the action with the largest q-value in each state of the flat q table
+      """
+      return self.q_table.argmax(axis=1)
+
+   def evaluate(self, n_rollouts = 1000, seed = None, crash_type = 0, exact = False):
+      """Runs many noisy rollouts of the greedy policy at once
+
+      Args:
+         n_rollouts (int): the number of rollouts to run
+         seed (int): the seed of the random generator
+         crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+         exact (bool): whether to also compute the exact expected number of steps from each starting point
+
+      Returns:
+         the summary statistics of Evaluation.evaluate
+      """
+      model = self.track.transition_model(crash_type, self.compact)
+      return Evaluation.evaluate(model, self.greedy_policy(), n_rollouts, seed, exact=exact)
+
 ## Simulation
-   def test(self, crash_type):
+   @Profiler.timed("SARSA.test")
+   def test(self, crash_type, seed = None):
       """Runs a car from the start to the finish
       
       Args:
          crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+         seed (int): the seed of the action selector's random generator, None for fresh entropy
          
       Returns:
          self.num_test_iter (int): the number of steps required to get to the finish
          steps (array): the list of steps taken
       """
-      start_pos = random.choice(self.track.start_line)
-      car = Car(start_pos[0], start_pos[1])
+      model = self.track.transition_model(crash_type, self.compact)
+      q_table = self.q_table
+      selector = ActionSelector(len(self.actions), seed)
+      start_pos = self.track.start_line[selector.integer(len(self.track.start_line))]
+      state = model.encode(start_pos[0], start_pos[1], 0, 0)
 
       self.num_test_iter = 0
       finished = False
       steps = [start_pos]
-      epsilon = 0
       while not finished and self.num_test_iter < 1000:
-         old_position = [car.y, car.x]
-
-         q_vals = self.q_table[car.y][car.x][car.vy + 5][car.vx + 5]
-
-         index = Helpers.epsilon_greedy(q_vals, epsilon)
-         action = self.actions[index]
+         index = int(q_table[state].argmax())
 
          self.num_test_iter += 1
 
          # Nondeterministic Step
-         if random.random() <= .8:
-            car.step(action[0], action[1])
-         else:
-            car.step(0, 0)
-         finished = Helpers.crossed_finish([old_position[0], old_position[1]], [car.y, car.x], self.track)
-         crash = Helpers.did_crash([old_position[0], old_position[1]], [car.y, car.x], self.track)
-         if crash[0] != None:
-            if crash_type:
-               car.crash_reset(Helpers.get_nearest_start(self.track, crash))
-            else:
-               car.crash_reset(crash)
-         steps.append([car.y, car.x])
-      return self.num_test_iter, steps
+         action_index = 3
+         if selector.chance(.8):
+            action_index = index
+         finished = model.finished[state, action_index]
+         state = model.next_state[state, action_index]
+         y, x, vy, vx = model.decode(state)
+         steps.append([y, x])
+      Profiler.count("test_steps", len(steps) - 1)
+      return self.num_test_iter, steps
\ No newline at end of file
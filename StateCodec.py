@@ -0,0 +1,54 @@
+import numpy as np
+
+# Velocities are clipped to [-MAX_SPEED, MAX_SPEED] in each direction
+MAX_SPEED = 5
+N_VELOCITIES = 2 * MAX_SPEED + 1
+
+class StateCodec:
+   def __init__(self, rows, cols):
+      """Packs the state (y, x, vy, vx) of a car into one integer
+      States are numbered in the same order as a (rows, cols, 11, 11) table, so a flat table row is a state's code
+
+      Args:
+         rows (int): the number of rows of the track
+         cols (int): the number of columns of the track
+      """
+      self.rows = rows
+      self.cols = cols
+      self.shape = (rows, cols, N_VELOCITIES, N_VELOCITIES)
+      self.n_states = rows * cols * N_VELOCITIES * N_VELOCITIES
+
+   def encode(self, y, x, vy, vx):
+      """Finds the code of a state
+      Works on ints or on arrays of states
+
+      Args:
+         y (int): the y-position of the car
+         x (int): the x-position of the car
+         vy (int): the velocity in the y-direction, in range [-5, 5]
+         vx (int): the velocity in the x-direction, in range [-5, 5]
+
+      Returns:
+         the code of the state
+      """
+      return ((y * self.cols + x) * N_VELOCITIES + vy + MAX_SPEED) * N_VELOCITIES + vx + MAX_SPEED
+
+   def decode(self, state):
+      """Finds the components of a state's code
+      Works on an int, giving ints, or on an array of codes, giving arrays
+
+      Args:
+         state (int): the code of the state
+
+      Returns:
+         (y, x, vy, vx): the position and velocity of the car
+      """
+      if np.ndim(state) == 0:
+         state, vx = divmod(int(state), N_VELOCITIES)
+         state, vy = divmod(state, N_VELOCITIES)
+         y, x = divmod(state, self.cols)
+         return y, x, vy - MAX_SPEED, vx - MAX_SPEED
+      state, vx = np.divmod(np.asarray(state, dtype=np.int64), N_VELOCITIES)
+      state, vy = np.divmod(state, N_VELOCITIES)
+      y, x = np.divmod(state, self.cols)
+      return y, x, vy - MAX_SPEED, vx - MAX_SPEED
\ No newline at end of file
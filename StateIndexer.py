@@ -0,0 +1,120 @@
+import numpy as np
+from TransitionModel import TransitionModel, ACTIONS, CHUNK_STATES, simulate
+from StateCodec import StateCodec
+import Cells
+import Profiler
+
+class StateIndexer:
+   @Profiler.timed("state_indexer")
+   def __init__(self, track, actions = ACTIONS):
+      """Enumerates the states reachable from the start line
+      A breadth first search from every starting point at rest simulates every action from the frontier states only,
+      so no full transition model is ever built.
+      A crash with crash type 1 only leads back to a starting point at rest, where the search starts anyway,
+      so following crash type 0 finds the states of both and the same compact indices work for either
+
+      Args:
+         track (Racetrack): the track to search
+         actions (matrix): the accelerations [ay, ax] to follow
+      """
+      self.track = track
+      self.actions = actions
+      self.codec = StateCodec(*track.grid.shape)
+      self.shape = self.codec.shape
+      self.n_full_states = self.codec.n_states
+
+      start = np.array(track.start_line, dtype=np.int64).reshape(-1, 2)
+      frontier = np.unique(self.codec.encode(start[:, 0], start[:, 1], 0, 0))
+      reachable = np.zeros(self.n_full_states, dtype=bool)
+      reachable[frontier] = True
+      while len(frontier):
+         successors = np.unique(np.concatenate([simulate(track, self.codec, frontier[first:first + CHUNK_STATES], 0, np.array(actions))[0].reshape(-1)
+            for first in range(0, len(frontier), CHUNK_STATES)]))
+         frontier = successors[~reachable[successors]]
+         reachable[frontier] = True
+
+      # states[i] is the full flat index of compact state i, index[s] is the compact index of full state s or -1
+      self.states = np.flatnonzero(reachable)
+      self.n_states = len(self.states)
+      self.index = np.full(self.n_full_states, -1, dtype=np.int32 if self.n_full_states < 2 ** 31 else np.int64)
+      self.index[self.states] = np.arange(self.n_states)
+
+   def compact(self, crash_type = 0):
+      """Tabulates the transition model of the reachable states
+
+      Args:
+         crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+
+      Returns:
+         a CompactTransitionModel indexed by compact state
+      """
+      return CompactTransitionModel(self, crash_type)
+
+class CompactTransitionModel(TransitionModel):
+   @Profiler.timed("compact_model")
+   def __init__(self, indexer, crash_type = 0):
+      """Tabulates the outcome of every action from the reachable states only, without building the full model
+      Lookups work exactly like a TransitionModel, with states numbered 0 to indexer.n_states - 1
+
+      Args:
+         indexer (StateIndexer): the indexer of the reachable states
+         crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+      """
+      self.track = indexer.track
+      self.crash_type = crash_type
+      self.actions = indexer.actions
+      self.codec = indexer.codec
+      self.shape = indexer.shape
+      self.indexer = indexer
+      self.n_states = indexer.n_states
+
+      self.next_state = np.empty((self.n_states, len(self.actions)), dtype=np.int64)
+      self.finished = np.empty((self.n_states, len(self.actions)), dtype=bool)
+      self.crashed = np.empty((self.n_states, len(self.actions)), dtype=bool)
+      self.predecessor_index = None
+      for first in range(0, self.n_states, CHUNK_STATES):
+         self.tabulate(first, min(self.n_states, first + CHUNK_STATES), np.array(self.actions))
+
+      y, x = self.codec.decode(indexer.states)[:2]
+      self.wall = self.track.grid[y, x] == Cells.WALL
+      self.finish = self.track.grid[y, x] == Cells.FINISH
+
+   def tabulate(self, start, stop, actions):
+      """Simulates every action from a range of compact states, writing the outcomes into the tables
+
+      Args:
+         start (int): the first compact state to simulate
+         stop (int): the end of the range of compact states
+         actions (matrix): the accelerations [ay, ax], in action index order
+      """
+      next_state, finished, crashed = simulate(self.track, self.codec, self.indexer.states[start:stop], self.crash_type, actions)
+      self.next_state[start:stop] = self.indexer.index[next_state]
+      self.finished[start:stop] = finished
+      self.crashed[start:stop] = crashed
+
+   def encode(self, y, x, vy, vx):
+      """Finds the compact index of a state
+      Works on ints or on arrays of states
+
+      Args:
+         y (int): the y-position of the car
+         x (int): the x-position of the car
+         vy (int): the velocity in the y-direction, in range [-5, 5]
+         vx (int): the velocity in the x-direction, in range [-5, 5]
+
+      Returns:
+         the compact index of the state, or -1 if it is not reachable
+      """
+      return self.indexer.index[self.codec.encode(y, x, vy, vx)]
+
+   def decode(self, state):
+      """Finds the components of a compact state index
+      Works on an int or on an array of states
+
+      Args:
+         state (int): the compact index of the state
+
+      Returns:
+         (y, x, vy, vx): the position and velocity of the car
+      """
+      return self.codec.decode(self.indexer.states[state])
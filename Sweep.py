@@ -0,0 +1,146 @@
+import csv
+import hashlib
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+def expand_grid(**params):
+   """Expands lists of hyperparameter values into every combination
+   Combinations are produced in the same order as nested for loops over the arguments
+
+   Args:
+      params (dict): the name of each hyperparameter and the list of values it takes
+
+   Returns:
+      specs (array): one dictionary per trial, mapping hyperparameter names to values
+   """
+   names = list(params)
+   return [dict(zip(names, values)) for values in itertools.product(*params.values())]
+
+def trial_seed(spec, base_seed = 0):
+   """Derives a deterministic seed for a trial from its hyperparameters
+
+   Args:
+      spec (dict): the hyperparameters of the trial
+      base_seed (int): the seed of the whole sweep
+
+   Returns:
+      the seed of the trial
+   """
+   key = repr(sorted(spec.items())) + "|" + str(base_seed)
+   return int.from_bytes(hashlib.sha256(key.encode("UTF8")).digest()[:4], "little")
+
+def run_trial(trial_fn, spec, seed):
+   """Seeds the random generators and runs a single trial
+
+   Args:
+      trial_fn (function): the function taking a spec and returning a result row
+      spec (dict): the hyperparameters of the trial
+      seed (int): the seed of the trial
+
+   Returns:
+      the result row of the trial
+   """
+   random.seed(seed)
+   np.random.seed(seed)
+   return trial_fn(spec)
+
+class CsvWriter:
+   def __init__(self, filename, header, key_columns):
+      """Initializes a CSV that rows are streamed to as trials finish
+      An existing file with the same header is appended to, so a partially completed sweep can be resumed
+
+      Args:
+         filename (string): the filename to write to
+         header (array): the header row
+         key_columns (array): the header columns that identify a trial, taken from its spec
+      """
+      self.filename = filename
+      self.header = header
+      self.key_columns = key_columns
+
+      rows = []
+      if os.path.exists(filename):
+         # Drop a partially written last row
+         with open(filename, 'r+', newline="", encoding='UTF8') as f:
+            content = f.read()
+            if content and not content.endswith("\n"):
+               f.seek(0)
+               f.truncate(len(content[:content.rfind("\n") + 1].encode('UTF8')))
+         with open(filename, 'r', newline="", encoding='UTF8') as f:
+            rows = list(csv.reader(f))
+         if not rows or rows[0] != header:
+            raise ValueError(filename + " exists with a different header")
+
+      if not rows:
+         with open(filename, 'w', newline="", encoding='UTF8') as f:
+            csv.writer(f).writerow(header)
+         rows = [header]
+
+      columns = [header.index(column) for column in key_columns]
+      self.done = set(tuple(row[column] for column in columns) for row in rows[1:])
+
+   def key(self, spec):
+      """Finds the key identifying a trial, as it appears on disk
+
+      Args:
+         spec (dict): the hyperparameters of the trial
+
+      Returns:
+         the key of the trial
+      """
+      return tuple(str(spec[column]) for column in self.key_columns)
+
+   def completed(self, spec):
+      """Determines whether a trial has already been written
+
+      Args:
+         spec (dict): the hyperparameters of the trial
+
+      Returns:
+         True if the trial is already on disk, False otherwise
+      """
+      return self.key(spec) in self.done
+
+   def write(self, spec, row):
+      """Appends the row of a finished trial
+
+      Args:
+         spec (dict): the hyperparameters of the trial
+         row (array): the result row of the trial
+      """
+      with open(self.filename, 'a', newline="", encoding='UTF8') as f:
+         csv.writer(f).writerow(row)
+      self.done.add(self.key(spec))
+
+def run_sweep(trial_fn, specs, writer, workers = None, base_seed = 0):
+   """Runs every trial that is not already on disk, writing each row as soon as it finishes
+
+   Args:
+      trial_fn (function): the function taking a spec and returning a result row, must be defined at module level
+      specs (array): the hyperparameters of each trial
+      writer (CsvWriter): where the result rows are written
+      workers (int): the number of worker processes, None for one per core, 1 to run in this process
+      base_seed (int): the seed of the whole sweep
+
+   Returns:
+      the number of trials that were run
+   """
+   todo = [spec for spec in specs if not writer.completed(spec)]
+   print("Running " + str(len(todo)) + " of " + str(len(specs)) + " trials")
+
+   if workers == 1:
+      for i, spec in enumerate(todo):
+         writer.write(spec, run_trial(trial_fn, spec, trial_seed(spec, base_seed)))
+         print("Finished " + str(i + 1) + "/" + str(len(todo)) + ": " + str(spec))
+      return len(todo)
+
+   with ProcessPoolExecutor(max_workers=workers) as pool:
+      futures = {pool.submit(run_trial, trial_fn, spec, trial_seed(spec, base_seed)): spec for spec in todo}
+      for i, future in enumerate(as_completed(futures)):
+         spec = futures[future]
+         writer.write(spec, future.result())
+         print("Finished " + str(i + 1) + "/" + str(len(todo)) + ": " + str(spec))
+   return len(todo)
@@ -0,0 +1,132 @@
+import argparse
+import numpy as np
+import Cells
+
+def corridor(rows, cols, width = 4):
+   """Generates a straight corridor, starting on the left and finishing on the right
+
+   Args:
+      rows (int): the number of rows of the track, walls included
+      cols (int): the number of columns of the track, walls included
+      width (int): the width of the corridor
+
+   Returns:
+      the grid of cell types
+   """
+   if rows < width + 2 or cols < 4:
+      raise ValueError("A corridor of width " + str(width) + " needs at least " + str(width + 2) + " x 4 cells")
+   grid = np.full((rows, cols), Cells.WALL, dtype=np.uint8)
+   top = (rows - width) // 2
+   grid[top:top + width, 1:cols - 1] = Cells.TRACK
+   grid[top:top + width, 1] = Cells.START
+   grid[top:top + width, cols - 2] = Cells.FINISH
+   return grid
+
+def loop(rows, cols, width = 4):
+   """Generates a rectangular loop, like the O-track
+   The start and finish lines sit next to each other on the left side, separated by a wall,
+   so a car has to go all the way around to finish
+
+   Args:
+      rows (int): the number of rows of the track, walls included
+      cols (int): the number of columns of the track, walls included
+      width (int): the width of the corridor
+
+   Returns:
+      the grid of cell types
+   """
+   if rows < 2 * width + 5 or cols < 2 * width + 3:
+      raise ValueError("A loop of width " + str(width) + " needs at least " + str(2 * width + 5) + " x " + str(2 * width + 3) + " cells")
+   grid = np.full((rows, cols), Cells.WALL, dtype=np.uint8)
+   grid[1:rows - 1, 1:cols - 1] = Cells.TRACK
+   grid[width + 1:rows - width - 1, width + 1:cols - width - 1] = Cells.WALL
+
+   # Cut the left side across with a wall, the start line below it and the finish line above it
+   middle = rows // 2
+   grid[middle, 1:width + 1] = Cells.WALL
+   grid[middle + 1, 1:width + 1] = Cells.START
+   grid[middle - 1, 1:width + 1] = Cells.FINISH
+   return grid
+
+def chicane(rows, cols, width = 4, turns = 4, wall = 1):
+   """Generates a serpentine track of horizontal lanes joined by hairpins at alternating ends
+
+   Args:
+      rows (int): the number of rows of the track, walls included
+      cols (int): the number of columns of the track, walls included
+      width (int): the width of the corridor
+      turns (int): the number of hairpins
+      wall (int): the thickness of the walls between lanes
+
+   Returns:
+      the grid of cell types
+   """
+   lanes = turns + 1
+   needed = lanes * width + turns * wall + 2
+   if rows < needed or cols < 2 * width + 3:
+      raise ValueError("A chicane of width " + str(width) + " with " + str(turns) + " turns needs at least " + str(needed) + " x " + str(2 * width + 3) + " cells")
+   grid = np.full((rows, cols), Cells.WALL, dtype=np.uint8)
+   pitch = (rows - 2 + wall) // lanes
+   for lane in range(lanes):
+      top = 1 + lane * pitch
+      grid[top:top + width, 1:cols - 1] = Cells.TRACK
+      if lane < turns:
+         # Join this lane to the next one at the end it runs towards
+         hairpin = slice(cols - 1 - width, cols - 1) if lane % 2 == 0 else slice(1, width + 1)
+         grid[top:top + pitch + width, hairpin] = Cells.TRACK
+
+   grid[1:1 + width, 1] = Cells.START
+   last = 1 + turns * pitch
+   grid[last:last + width, 1 if turns % 2 else cols - 2] = Cells.FINISH
+   return grid
+
+GENERATORS = {"corridor": corridor, "loop": loop, "chicane": chicane}
+
+def write_text(grid, filename):
+   """Writes a grid in the text format of the bundled tracks
+
+   Args:
+      grid (matrix): the grid of cell types
+      filename (string): the filename to write to
+   """
+   with open(filename, "w") as f:
+      f.write(str(grid.shape[0]) + "," + str(grid.shape[1]) + "\n")
+      for row in Cells.CHARACTERS[grid]:
+         f.write(row.tobytes().decode("latin-1") + "\n")
+
+def save_grid(grid, filename):
+   """Writes a grid as a binary .npy file, which Racetrack memory maps instead of parsing
+
+   Args:
+      grid (matrix): the grid of cell types
+      filename (string): the filename to write to, ending in .npy
+   """
+   np.save(filename, np.ascontiguousarray(grid, dtype=np.uint8))
+
+def save(grid, filename):
+   """Writes a grid, as binary if the filename ends in .npy and as text otherwise
+
+   Args:
+      grid (matrix): the grid of cell types
+      filename (string): the filename to write to
+   """
+   if filename.endswith(".npy"):
+      save_grid(grid, filename)
+   else:
+      write_text(grid, filename)
+
+if __name__ == "__main__":
+   parser = argparse.ArgumentParser(description="Generates racetracks")
+   parser.add_argument("kind", choices=sorted(GENERATORS), help="the layout of the track")
+   parser.add_argument("rows", type=int, help="the number of rows, walls included")
+   parser.add_argument("cols", type=int, help="the number of columns, walls included")
+   parser.add_argument("output", help="the file to write, binary if it ends in .npy and text otherwise")
+   parser.add_argument("--width", type=int, default=4, help="the width of the corridor")
+   parser.add_argument("--turns", type=int, default=4, help="the number of hairpins of a chicane")
+   args = parser.parse_args()
+
+   if args.kind == "chicane":
+      grid = chicane(args.rows, args.cols, args.width, args.turns)
+   else:
+      grid = GENERATORS[args.kind](args.rows, args.cols, args.width)
+   save(grid, args.output)
@@ -0,0 +1,169 @@
+import numpy as np
+import Helpers
+import Cells
+import Profiler
+from StateCodec import StateCodec
+
+ACTIONS = [[-1, -1], [-1, 0], [0, -1], [0, 0], [0, 1], [1, 0], [1, 1], [-1, 1], [1, -1]]
+
+# About how many states are simulated at once, bounding the size of the temporary arrays of a build
+CHUNK_STATES = 1 << 16
+
+def simulate(track, codec, states, crash_type, actions):
+   """Simulates every action from some states
+
+   Args:
+      track (Racetrack): the track to simulate on
+      codec (StateCodec): the codec of the track's states
+      states (array): the codes of the states to simulate
+      crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+      actions (matrix): the accelerations [ay, ax], in action index order
+
+   Returns:
+      next_state (matrix): the code of the state reached by each action from each state
+      finished (matrix): whether each move finished the race
+      crashed (matrix): whether each move stopped the car, at the wall or the finish line
+   """
+   n_states = len(states)
+   y, x, vy, vx = (component.reshape(-1, 1) for component in codec.decode(states))
+
+   # Advance every car with every action, velocities are clipped to range [-5, 5]
+   new_vy = np.clip(vy + actions[:, 0], -5, 5)
+   new_vx = np.clip(vx + actions[:, 1], -5, 5)
+   new_y = y + new_vy
+   new_x = x + new_vx
+
+   # Check if we finished and/or crashed (both can happen) along every move at once
+   if track.collision_cache is not None:
+      finished, crashed, crash_points = track.collision_cache.lookup_batch(*np.broadcast_arrays(y, x, new_vy, new_vx))
+   else:
+      old_positions = np.stack(np.broadcast_arrays(y, x, new_y)[:2], axis=-1).reshape(-1, 2)
+      new_positions = np.stack((new_y, new_x), axis=-1).reshape(-1, 2)
+      finished, crashed, crash_points = Helpers.trace_segments(old_positions, new_positions, track)
+   finished = finished.reshape(n_states, len(actions))
+   crashed = crashed.reshape(n_states, len(actions))
+
+   # Handle crashes, velocities get set to 0
+   crash_points = crash_points.reshape(n_states, len(actions), 2)
+   # Reaching the finish line also stops the car, but only running into the wall sends it back to the start
+   if crash_type:
+      wall_crash = crashed & ~finished
+      crash_points[wall_crash] = Helpers.get_nearest_starts(track, crash_points[wall_crash])
+   new_y = np.where(crashed, crash_points[:, :, 0], new_y)
+   new_x = np.where(crashed, crash_points[:, :, 1], new_x)
+   new_vy = np.where(crashed, 0, new_vy)
+   new_vx = np.where(crashed, 0, new_vx)
+   return codec.encode(new_y, new_x, new_vy, new_vx), finished, crashed
+
+class TransitionModel:
+   @Profiler.timed("transition_model")
+   def __init__(self, track, crash_type = 0, actions = ACTIONS):
+      """Tabulates the outcome of every (y, x, vy, vx, action) on a track
+
+      The outcome of a step only depends on the state, the action and the crash type,
+      so it is simulated once here and looked up afterwards.
+      States are numbered by their StateCodec code, the same order as a (rows, cols, 11, 11) table.
+
+      Args:
+         track (Racetrack): the track to tabulate
+         crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+         actions (matrix): the accelerations [ay, ax] to tabulate, in action index order
+      """
+      self.track = track
+      self.crash_type = crash_type
+      self.actions = actions
+      self.codec = StateCodec(*track.grid.shape)
+      self.shape = self.codec.shape
+      self.n_states = self.codec.n_states
+
+      # next_state[s][a] is the flat index of the state reached by taking action a in state s
+      self.next_state = np.empty((self.n_states, len(actions)), dtype=np.int64)
+      self.finished = np.empty((self.n_states, len(actions)), dtype=bool)
+      self.crashed = np.empty((self.n_states, len(actions)), dtype=bool)
+      self.predecessor_index = None
+
+      # Simulate a band of whole track rows at a time, so large tracks never hold every move's temporaries at once
+      rows, cols = track.grid.shape
+      states_per_row = cols * 121
+      band = max(1, CHUNK_STATES // states_per_row)
+      for first_row in range(0, rows, band):
+         self.tabulate(first_row * states_per_row, min(rows, first_row + band) * states_per_row, np.array(actions))
+
+      # Whether each state is in a wall or on the finish line
+      self.wall = np.repeat((track.grid == Cells.WALL).reshape(-1), 121)
+      self.finish = np.repeat((track.grid == Cells.FINISH).reshape(-1), 121)
+
+   def tabulate(self, start, stop, actions):
+      """Simulates every action from a range of states, writing the outcomes into the tables
+
+      Args:
+         start (int): the first state to simulate
+         stop (int): the end of the range of states
+         actions (matrix): the accelerations [ay, ax], in action index order
+      """
+      next_state, finished, crashed = simulate(self.track, self.codec, np.arange(start, stop, dtype=np.int64), self.crash_type, actions)
+      self.next_state[start:stop] = next_state
+      self.finished[start:stop] = finished
+      self.crashed[start:stop] = crashed
+
+   def encode(self, y, x, vy, vx):
+      """Finds the flat index of a state
+      Works on ints or on arrays of states
+
+      Args:
+         y (int): the y-position of the car
+         x (int): the x-position of the car
+         vy (int): the velocity in the y-direction, in range [-5, 5]
+         vx (int): the velocity in the x-direction, in range [-5, 5]
+
+      Returns:
+         the flat index of the state
+      """
+      return self.codec.encode(y, x, vy, vx)
+
+   def decode(self, state):
+      """Finds the components of a flat state index
+      Works on an int or on an array of states
+
+      Args:
+         state (int): the flat index of the state
+
+      Returns:
+         (y, x, vy, vx): the position and velocity of the car
+      """
+      return self.codec.decode(state)
+
+   def predecessors(self):
+      """Builds the reverse-transition index on first use
+      The predecessors of state s are predecessor_states[predecessor_start[s]:predecessor_start[s + 1]],
+      every state that reaches s with some action, as well as s itself since the car can stay where it is
+
+      Returns:
+         predecessor_start (array): where the predecessors of each state start, of length n_states + 1
+         predecessor_states (array): the predecessors of every state, grouped by state
+      """
+      if self.predecessor_index is None:
+         states = np.arange(self.n_states, dtype=np.int64)
+         sources = np.concatenate((np.repeat(states, self.next_state.shape[1]), states))
+         targets = np.concatenate((self.next_state.reshape(-1), states))
+         pairs = np.unique(targets * self.n_states + sources)
+         predecessor_start = np.zeros(self.n_states + 1, dtype=np.int64)
+         np.cumsum(np.bincount(pairs // self.n_states, minlength=self.n_states), out=predecessor_start[1:])
+         self.predecessor_index = (predecessor_start, pairs % self.n_states)
+      return self.predecessor_index
+
+   def reachable_states(self):
+      """Finds the states reachable from the start line at rest by following the model
+
+      Returns:
+         the sorted indices of the reachable states
+      """
+      start = np.array(self.track.start_line, dtype=np.int64).reshape(-1, 2)
+      frontier = np.unique(self.encode(start[:, 0], start[:, 1], 0, 0))
+      reachable = np.zeros(self.n_states, dtype=bool)
+      reachable[frontier] = True
+      while len(frontier):
+         successors = np.unique(self.next_state[frontier].reshape(-1))
+         frontier = successors[~reachable[successors]]
+         reachable[frontier] = True
+      return np.flatnonzero(reachable)
\ No newline at end of file
@@ -1,26 +1,48 @@
 import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
 from Racetrack import Racetrack
-from Car import Car
-import random
-import copy
-import Helpers
+from StateCodec import StateCodec
+from ActionSelector import ActionSelector
+import Checkpoint
+import Evaluation
+import Profiler
+import ParallelSweep
+
+# Prioritized sweeping backs up every queued state whose residual is at least this fraction of the largest one in each round
+PRIORITY_BAND = .5
 
 class ValueIteration:
-   def __init__(self, filename):
+   def __init__(self, filename, compact = False, dtype = np.float64, policy_dtype = None):
       """ Initializes the class
       Args:
          filename (string): the name of the file containing the Racetrack
+         compact (bool): whether to only store the states reachable from the start line, as flat tables
+         dtype (type): the float type of the value and q tables, such as np.float32 or np.float16
+         policy_dtype (type): None to store the policy as float [ay, ax] pairs, a float type to store the pairs
+            with that type, or an integer type such as np.int8 to store the index of the action instead
       """
+      self.filename = filename
+      self.options = {"compact": compact, "dtype": np.dtype(dtype).name, "policy_dtype": None if policy_dtype is None else np.dtype(policy_dtype).name}
       self.track = Racetrack(filename)
       self.actions = [[-1, -1], [-1, 0], [0, -1], [0, 0], [0, 1], [1, 0], [1, 1], [-1, 1], [1, -1]]
-      self.n_states = (len(self.track.track), len(self.track.track[0]), 11, 11)
-      self.value_table = np.zeros(self.n_states)
-      self.q_table = np.zeros((self.n_states[0], self.n_states[1], self.n_states[2], self.n_states[3], len(self.actions)))
-      self.policy_table = np.zeros((self.n_states[0], self.n_states[1], self.n_states[2], self.n_states[3], 2))
+      self.codec = StateCodec(*self.track.grid.shape)
+      self.compact = compact
+      # Tables are flat, one row per state code, or per compact index when compact
+      self.n_states = self.track.state_indexer().n_states if compact else self.codec.n_states
+      self.table_shape = (self.n_states,)
+      self.value_table = np.zeros(self.table_shape, dtype=dtype)
+      self.q_table = np.zeros(self.table_shape + (len(self.actions),), dtype=dtype)
+      self.policy_index = policy_dtype is not None and np.issubdtype(policy_dtype, np.integer)
+      if self.policy_index:
+         self.policy_table = np.full(self.table_shape, self.actions.index([0, 0]), dtype=policy_dtype)
+      else:
+         self.policy_table = np.zeros(self.table_shape + (2,), dtype=np.float64 if policy_dtype is None else policy_dtype)
       self.num_train_iter = 0
       self.num_test_iter = 0
 
-   def train(self, discount = .9, threshold = .1, crash_type = 0, max_iter = 100):
+   @Profiler.timed("ValueIteration.train")
+   def train(self, discount = .9, threshold = .1, crash_type = 0, max_iter = 100, backend = "python", checkpoint_path = None, checkpoint_every = None, resume = False, workers = None):
       """Trains Value Iteration
       
       Args:
@@ -28,82 +50,94 @@ class ValueIteration:
          threshold (float): the limit at which to stop training
          crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
          max_iter (int): the max number of iterations through each state to allow
+         backend (string): "python" to sweep state by state, "numpy" to do each sweep as whole-array operations,
+            "parallel" to split each numpy sweep across worker processes, or "prioritized" to back up states in order of their Bellman residual
+         checkpoint_path (string): the directory to save checkpoints to and resume from
+         checkpoint_every (int): the number of iterations between checkpoints, None to never checkpoint
+         resume (bool): whether to continue from the checkpoint in checkpoint_path, if there is one
+         workers (int): the number of worker processes of the parallel backend, None for one per core
       
       Returns:
          past_value_difference (array): the sequence of differences between deltas in each iteration
          self.num_train_iter (array): the number of iterations of each episode it took to reach the finish line
       """
-      start_pos = random.choice(self.track.start_line)
-      car = Car(start_pos[0], start_pos[1])
+      self.hyperparameters = {"discount": discount, "threshold": threshold, "crash_type": crash_type, "max_iter": max_iter, "backend": backend}
+      model = self.track.transition_model(crash_type, self.compact)
+
+      # Pick up where the last checkpoint left off
       past_value_difference = []
+      metadata = Checkpoint.read_metadata(checkpoint_path) if resume else None
+      if metadata is not None and metadata["training_state"] is not None:
+         Checkpoint.load_tables(self, checkpoint_path)
+         past_value_difference = metadata["training_state"]["past_value_difference"]
+         if metadata["training_state"]["converged"]:
+            return past_value_difference, self.num_train_iter
+
+      if backend == "numpy":
+         return self.train_numpy(model, discount, threshold, max_iter, past_value_difference, checkpoint_path, checkpoint_every)
+      elif backend == "parallel":
+         return self.train_parallel(model, discount, threshold, max_iter, workers, past_value_difference, checkpoint_path, checkpoint_every)
+      elif backend == "prioritized":
+         if checkpoint_every:
+            raise ValueError("Checkpoints need the python, numpy or parallel backend")
+         return self.train_prioritized(model, discount, threshold, max_iter)
+      elif backend != "python":
+         raise ValueError("Unknown backend: " + str(backend))
+      if self.compact:
+         raise ValueError("Compact tables need the numpy or prioritized backend")
+
+      value_table = self.value_table
+      q_table = self.q_table
+      policy_table = self.policy_table
+      rows, cols, n_vy, n_vx = self.codec.shape
       converged = False
       # Number of steps
       while self.num_train_iter < max_iter and not converged:
-         old_value = copy.deepcopy(self.value_table)
+         old_value = value_table.copy()
          delta = 0
          # For every state
          # X coordinate
-         for y in range(self.n_states[0]):
+         for y in range(rows):
             # Y coordinate
-            for x in range(self.n_states[1]):
+            for x in range(cols):
                # X velocity
-               for vy in range(self.n_states[2]):
+               for vy in range(n_vy):
                   # Y velocity
-                  for vx in range(self.n_states[3]):
+                  for vx in range(n_vx):
+                     state = model.encode(y, x, vy - 5, vx - 5)
                      # If we are in a wall, don't consider actions
                      if self.track.track[y][x] == "#":
-                        self.value_table[y][x][vy][vx] = -1
+                        value_table[state] = -1
                         continue
                      max_action_value = float('-inf')
                      policy = [0, 0]
-                     action_index = 0
+                     policy_index = self.actions.index(policy)
+                     old_v = value_table[state]
+
                      # For every accelaration possible
-                     for action in self.actions:
-                        # Set car's state as specified by for loops
-                        car.x = x
-                        car.y = y
-                        car.vx = vx - 5
-                        car.vy = vy - 5
-
-                        old_position = [car.y, car.x]
-                        old_v = self.value_table[car.y][car.x][car.vy + 5][car.vx + 5]
-
-                        # Advance the car
-                        car.step(action[0], action[1])
-                        
-                        # Check if we finished and/or crashed (both can happen)
-                        finished = Helpers.crossed_finish([old_position[0], old_position[1]], [car.y, car.x], self.track)
-                        crash = Helpers.did_crash([old_position[0], old_position[1]], [car.y, car.x], self.track)
+                     for action_index, action in enumerate(self.actions):
                         reward = -1
-
-                        # Handle crash if it occurs
-                        if crash[0] != None:
-                           if crash_type:
-                              car.crash_reset(Helpers.get_nearest_start(self.track, crash))
-                           else:
-                              car.crash_reset(crash)
-                        
                         new_v = 0
-                        
-                        if finished:
+
+                        # Look up whether we finished, and where the car ends up after any crash
+                        if model.finished[state, action_index]:
                            reward = 0
                         else:
-                           new_v = old_value[car.y][car.x][car.vy + 5][car.vx + 5]
+                           new_v = old_value[model.next_state[state, action_index]]
 
                         expected_value = new_v * 0.8 + old_v * 0.2
                         new_q = reward + discount * expected_value
-                        self.q_table[y][x][vy][vx][action_index] = new_q
+                        q_table[state, action_index] = new_q
                         
                         if new_q > max_action_value:
                            policy = action
+                           policy_index = action_index
                            max_action_value = new_q
-                        
-                        action_index += 1
 
                      # Update Value and policy tables
-                     old_q = self.value_table[y][x][vy][vx]
-                     self.value_table[y][x][vy][vx] = max_action_value
-                     self.policy_table[y][x][vy][vx] = policy
+                     old_q = value_table[state]
+                     value_table[state] = max_action_value
+                     policy_table[state] = policy_index if self.policy_index else policy
 
                      # Calculate the maximum value difference
                      delta_q = old_q - max_action_value
@@ -116,40 +150,371 @@ class ValueIteration:
 
          self.num_train_iter += 1
          past_value_difference.append(delta)
+         Profiler.count("sweeps")
+         Profiler.count("backups", model.n_states - int(model.wall.sum()))
+         self.checkpoint(checkpoint_path, checkpoint_every, past_value_difference, converged)
       return past_value_difference, self.num_train_iter
    
-   def test(self, crash_type = 0):
+   def train_numpy(self, model, discount, threshold, max_iter, past_value_difference = None, checkpoint_path = None, checkpoint_every = None):
+      """Trains Value Iteration with each synchronous sweep done as whole-array operations
+
+      Args:
+         model (TransitionModel): the transition model of the track
+         discount (float): the amount of discount to be applied
+         threshold (float): the limit at which to stop training
+         max_iter (int): the max number of iterations through each state to allow
+         past_value_difference (array): the differences of the iterations already done, when resuming
+         checkpoint_path (string): the directory to save checkpoints to
+         checkpoint_every (int): the number of iterations between checkpoints, None to never checkpoint
+
+      Returns:
+         past_value_difference (array): the sequence of differences between deltas in each iteration
+         self.num_train_iter (array): the number of iterations of each episode it took to reach the finish line
+      """
+      value_table = self.value_table
+      q_table = self.q_table
+      policy_table = self.policy_table
+      actions = np.array(self.actions)
+
+      # Walls are never considered, so only gather the outcomes of states on the track
+      wall = model.wall
+      on_track = np.flatnonzero(~wall)
+      next_state = model.next_state[on_track]
+      finished = model.finished[on_track]
+      reward = np.where(finished, 0, -1).astype(value_table.dtype)
+
+      past_value_difference = [] if past_value_difference is None else past_value_difference
+      converged = False
+      while self.num_train_iter < max_iter and not converged:
+         old_value = value_table.copy()
+         old_v = old_value[on_track]
+
+         # Finishing ends the race, otherwise the car moves with probability 0.8 and stays with probability 0.2
+         new_v = np.where(finished, 0, old_value[next_state])
+         expected_value = new_v * 0.8 + old_v[:, None] * 0.2
+         new_q = reward + discount * expected_value
+
+         best_action = new_q.argmax(axis=1)
+         max_action_value = new_q[np.arange(len(on_track)), best_action]
+
+         # Update Value and policy tables
+         q_table[on_track] = new_q
+         value_table[wall] = -1
+         value_table[on_track] = max_action_value
+         policy_table[on_track] = best_action if self.policy_index else actions[best_action]
+
+         # Calculate the maximum value difference
+         delta = 0
+         if len(on_track):
+            delta = max(delta, (old_v - max_action_value).max())
+
+         # Convergence criteria
+         if delta < threshold:
+            converged = True
+
+         self.num_train_iter += 1
+         past_value_difference.append(delta)
+         Profiler.count("sweeps")
+         Profiler.count("backups", len(on_track))
+         self.checkpoint(checkpoint_path, checkpoint_every, past_value_difference, converged)
+      return past_value_difference, self.num_train_iter
+
+   def train_parallel(self, model, discount, threshold, max_iter, workers = None, past_value_difference = None, checkpoint_path = None, checkpoint_every = None):
+      """Trains Value Iteration with each synchronous sweep split across worker processes
+      The states on the track are partitioned into blocks of whole track rows. Workers read the previous values and
+      write their block of the new ones through shared memory, so no table is ever pickled, and only each block's
+      largest value difference is sent back. The results are identical to train_numpy
+
+      Args:
+         model (TransitionModel): the transition model of the track
+         discount (float): the amount of discount to be applied
+         threshold (float): the limit at which to stop training
+         max_iter (int): the max number of iterations through each state to allow
+         workers (int): the number of worker processes, None for one per core
+         past_value_difference (array): the differences of the iterations already done, when resuming
+         checkpoint_path (string): the directory to save checkpoints to
+         checkpoint_every (int): the number of iterations between checkpoints, None to never checkpoint
+
+      Returns:
+         past_value_difference (array): the sequence of differences between deltas in each iteration
+         self.num_train_iter (array): the number of iterations of each episode it took to reach the finish line
+      """
+      value_table = self.value_table
+      q_table = self.q_table
+      policy_table = self.policy_table
+      actions = np.array(self.actions)
+      workers = workers or os.cpu_count()
+
+      wall = np.flatnonzero(model.wall)
+      on_track = np.flatnonzero(~model.wall)
+      full_states = model.indexer.states[on_track] if hasattr(model, "indexer") else on_track
+      bounds = ParallelSweep.row_blocks(full_states // (model.shape[1] * 121), workers)
+
+      # Double buffered values, each sweep reads one table and writes the other
+      tables = {
+         "on_track": on_track,
+         "next_state": model.next_state[on_track],
+         "finished": model.finished[on_track],
+         "values": np.stack((value_table, value_table)),
+         "q": np.zeros((len(on_track), len(self.actions)), dtype=value_table.dtype),
+         "best_action": np.zeros(len(on_track), dtype=np.int64),
+      }
+      blocks = []
+      specs = {}
+      shared = {}
+      try:
+         for name, array in tables.items():
+            block, specs[name], shared[name] = ParallelSweep.share(array)
+            blocks.append(block)
+         del tables
+
+         def update_tables(parity):
+            value_table[...] = shared["values"][parity]
+            q_table[on_track] = shared["q"]
+            best_action = shared["best_action"]
+            policy_table[on_track] = best_action if self.policy_index else actions[best_action]
+
+         past_value_difference = [] if past_value_difference is None else past_value_difference
+         converged = False
+         swept = False
+         parity = 0
+         with ProcessPoolExecutor(max_workers=workers, initializer=ParallelSweep.attach, initargs=(specs,)) as pool:
+            while self.num_train_iter < max_iter and not converged:
+               shared["values"][1 - parity][wall] = -1
+               futures = [pool.submit(ParallelSweep.sweep_block, start, stop, parity, discount) for start, stop in zip(bounds[:-1], bounds[1:])]
+               block_deltas = [future.result() for future in futures]
+               parity = 1 - parity
+               swept = True
+
+               # Calculate the maximum value difference
+               delta = 0
+               for block_delta in block_deltas:
+                  delta = max(delta, block_delta)
+
+               # Convergence criteria
+               if delta < threshold:
+                  converged = True
+
+               self.num_train_iter += 1
+               past_value_difference.append(delta)
+               Profiler.count("sweeps")
+               Profiler.count("backups", len(on_track))
+               if checkpoint_every and (converged or self.num_train_iter % checkpoint_every == 0):
+                  update_tables(parity)
+                  self.checkpoint(checkpoint_path, checkpoint_every, past_value_difference, converged)
+         if swept:
+            update_tables(parity)
+      finally:
+         shared.clear()
+         for block in blocks:
+            block.close()
+            block.unlink()
+      return past_value_difference, self.num_train_iter
+
+   def train_prioritized(self, model, discount, threshold, max_iter):
+      """Trains Value Iteration with prioritized sweeping
+      Only the states reachable from the start line are backed up, in rounds: each round backs up in place every queued state whose
+      Bellman residual is within PRIORITY_BAND of the largest one, then recomputes the residuals of their predecessors and queues
+      the ones at or above threshold. Training stops once every reachable state's residual is below threshold.
+      This saves backups rather than time: it does several times fewer backups than the synchronous sweeps,
+      but each round also gathers predecessors and updates the queue, so it is usually slower than the numpy backend.
+      The number of backups performed is stored in self.num_backups
+
+      Args:
+         model (TransitionModel): the transition model of the track
+         discount (float): the amount of discount to be applied
+         threshold (float): the limit at which to stop training
+         max_iter (int): the max number of iterations through each state to allow, counted in backups of as many states as are reachable
+
+      Returns:
+         past_value_difference (array): the largest remaining residual after each iteration's worth of backups
+         self.num_train_iter (array): the number of iterations' worth of backups performed
+      """
+      value_table = self.value_table
+      q_table = self.q_table
+      policy_table = self.policy_table
+      actions = np.array(self.actions)
+      predecessor_start, predecessor_states = model.predecessors()
+
+      wall = model.wall
+      on_track = np.flatnonzero(~wall)
+      value_table[wall] = -1
+      states = model.reachable_states()
+      states = states[~wall[states]]
+      reachable = np.zeros(len(value_table), dtype=bool)
+      reachable[states] = True
+
+      def residuals(batch):
+         q = self.bellman_q(model, batch, value_table, discount)
+         return np.abs(q.max(axis=1) - value_table[batch])
+
+      # The queue holds every state whose residual is at or above threshold, queued marks its members
+      priority = np.zeros(len(value_table))
+      priority[states] = residuals(states)
+      queue = states[priority[states] >= threshold]
+      queued = np.zeros(len(value_table), dtype=bool)
+      queued[queue] = True
+
+      self.num_backups = 0
+      first_iter = self.num_train_iter
+      past_value_difference = []
+      while len(queue) and self.num_train_iter < max_iter:
+         # Back up the states with the largest residuals together
+         residual = priority[queue]
+         batch = queue[residual >= residual.max() * PRIORITY_BAND]
+         value_table[batch] = self.bellman_q(model, batch, value_table, discount).max(axis=1)
+         priority[batch] = 0
+         self.num_backups += len(batch)
+
+         # Recompute the residuals of every reachable state whose backup depends on the batch, the batch included
+         counts = predecessor_start[batch + 1] - predecessor_start[batch]
+         offsets = np.repeat(predecessor_start[batch] - np.cumsum(counts) + counts, counts)
+         predecessors = np.unique(predecessor_states[offsets + np.arange(counts.sum())])
+         predecessors = predecessors[reachable[predecessors]]
+         priority[predecessors] = residuals(predecessors)
+
+         # Only the queued states and the predecessors can have changed, so the rest of the states need no rescan
+         settled = priority[queue] < threshold
+         queued[queue[settled]] = False
+         added = predecessors[(priority[predecessors] >= threshold) & ~queued[predecessors]]
+         queued[added] = True
+         queue = np.concatenate((queue[~settled], added))
+
+         while self.num_train_iter - first_iter < self.num_backups // len(states):
+            self.num_train_iter += 1
+            past_value_difference.append(float(priority[queue].max()) if len(queue) else 0)
+
+      if self.num_backups % max(len(states), 1) or not past_value_difference:
+         self.num_train_iter += 1
+         past_value_difference.append(float(priority[queue].max()) if len(queue) else 0)
+
+      Profiler.count("backups", self.num_backups)
+
+      # Extract the greedy q-values and policy from the final values
+      new_q = self.bellman_q(model, on_track, value_table, discount)
+      q_table[on_track] = new_q
+      best_action = new_q.argmax(axis=1)
+      policy_table[on_track] = best_action if self.policy_index else actions[best_action]
+      return past_value_difference, self.num_train_iter
+
+   def checkpoint(self, checkpoint_path, checkpoint_every, past_value_difference, converged):
+      """Saves a checkpoint every checkpoint_every iterations, and once training has converged
+
+      Args:
+         checkpoint_path (string): the directory to save checkpoints to
+         checkpoint_every (int): the number of iterations between checkpoints, None to never checkpoint
+         past_value_difference (array): the differences of the iterations done so far
+         converged (bool): whether training has converged
+      """
+      if checkpoint_every and (converged or self.num_train_iter % checkpoint_every == 0):
+         training_state = {"past_value_difference": [float(delta) for delta in past_value_difference], "converged": converged}
+         Checkpoint.save(self, checkpoint_path, ["value_table", "q_table", "policy_table"], training_state)
+
+   def save(self, path):
+      """Saves the value, q and policy tables with their metadata
+
+      Args:
+         path (string): the directory to write to
+      """
+      Checkpoint.save(self, path, ["value_table", "q_table", "policy_table"])
+
+   @classmethod
+   def load(cls, path, mmap_mode = None, filename = None):
+      """Loads a saved model
+
+      Args:
+         path (string): the directory the model was saved to
+         mmap_mode (string): None to read the tables into memory, or a numpy memory map mode such as "r"
+            to share one saved table read-only between processes without copying it
+         filename (string): the racetrack file, if it has moved since the model was saved
+
+      Returns:
+         the loaded model
+      """
+      return Checkpoint.load(cls, path, mmap_mode, filename)
+
+   def bellman_q(self, model, states, value_table, discount):
+      """Computes the q-values of states from the current value table
+
+      Args:
+         model (TransitionModel): the transition model of the track
+         states (array): the flat indices of the states
+         value_table (array): the flat value table
+         discount (float): the amount of discount to be applied
+
+      Returns:
+         the q-value of every action in every state, one row per state
+      """
+      finished = model.finished[states]
+      new_v = np.where(finished, 0, value_table[model.next_state[states]])
+      expected_value = new_v * 0.8 + value_table[states][:, None] * 0.2
+      return np.where(finished, 0, -1).astype(value_table.dtype) + discount * expected_value
+
+   def greedy_policy(self):
+      """Finds the action the policy table takes in every state
+
+      Returns:
+         the index of the policy's action in each state of the flat tables
+      """
+      if self.policy_index:
+         return self.policy_table.astype(np.int64)
+      # Actions are [ay, ax] pairs in [-1, 1], look their index up by position in a 3 x 3 grid
+      lookup = np.zeros((3, 3), dtype=np.int64)
+      for action_index, action in enumerate(self.actions):
+         lookup[action[0] + 1][action[1] + 1] = action_index
+      pairs = self.policy_table.astype(np.int64)
+      return lookup[pairs[:, 0] + 1, pairs[:, 1] + 1]
+
+   def evaluate(self, n_rollouts = 1000, seed = None, crash_type = 0, exact = False):
+      """Runs many noisy rollouts of the policy at once
+
+      Args:
+         n_rollouts (int): the number of rollouts to run
+         seed (int): the seed of the random generator
+         crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+         exact (bool): whether to also compute the exact expected number of steps from each starting point
+
+      Returns:
+         the summary statistics of Evaluation.evaluate
+      """
+      model = self.track.transition_model(crash_type, self.compact)
+      return Evaluation.evaluate(model, self.greedy_policy(), n_rollouts, seed, exact=exact)
+
+   @Profiler.timed("ValueIteration.test")
+   def test(self, crash_type = 0, seed = None):
       """Runs a car from the start to the finish
       
       Args:
          crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+         seed (int): the seed of the action selector's random generator, None for fresh entropy
          
       Returns:
          self.num_test_iter (int): the number of steps required to get to the finish
          steps (array): the list of steps taken
       """
-      start_pos = random.choice(self.track.start_line)
-      car = Car(start_pos[0], start_pos[1])
+      model = self.track.transition_model(crash_type, self.compact)
+      policy_table = self.policy_table
+      selector = ActionSelector(len(self.actions), seed)
+      start_pos = self.track.start_line[selector.integer(len(self.track.start_line))]
+      state = model.encode(start_pos[0], start_pos[1], 0, 0)
 
       finished = False
       steps = [start_pos]
 
       while not finished and self.num_test_iter < 1000:
-         old_position = [car.y, car.x]
-         action = self.policy_table[int(car.y)][int(car.x)][int(car.vy + 5)][int(car.vx + 5)]
+         action = policy_table[state]
          self.num_test_iter += 1
          
          # Nondeterministic step
-         if random.random() <= .8:
-            car.step(action[0], action[1])
-         else:
-            car.step(0, 0)
-         finished = Helpers.crossed_finish([old_position[0], old_position[1]], [car.y, car.x], self.track)
-         crash = Helpers.did_crash([old_position[0], old_position[1]], [car.y, car.x], self.track)
-         if crash[0] != None:
-            if crash_type:
-               car.crash_reset(Helpers.get_nearest_start(self.track, crash))
+         action_index = 3
+         if selector.chance(.8):
+            if self.policy_index:
+               action_index = int(action)
             else:
-               car.crash_reset(crash)
-         steps.append([car.y, car.x])
+               action_index = self.actions.index([int(action[0]), int(action[1])])
+         finished = model.finished[state, action_index]
+         state = model.next_state[state, action_index]
+         y, x, vy, vx = model.decode(state)
+         steps.append([y, x])
+      Profiler.count("test_steps", len(steps) - 1)
       return self.num_test_iter, steps
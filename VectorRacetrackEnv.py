@@ -0,0 +1,115 @@
+import numpy as np
+from TransitionModel import ACTIONS
+import Helpers
+from StateCodec import StateCodec
+
+class VectorRacetrackEnv:
+   def __init__(self, track, n_cars, crash_type = 0, seed = None, step_reward = -1, crash_reward = -10, finish_reward = 0):
+      """Initializes N cars that are driven in lockstep on the same track
+      Positions, velocities and done flags are held in NumPy arrays, one entry per car
+
+      Args:
+         track (Racetrack): the track the cars drive on
+         n_cars (int): the number of cars
+         crash_type (bool): whether the crash should reset to the nearest point (0), or the nearest starting point (1)
+         seed (int): the seed of the random generator used for starting points and action noise
+         step_reward (int): the reward of a regular step
+         crash_reward (int): the reward of a step that crashes
+         finish_reward (int): the reward of a step that finishes, takes precedence over crash_reward
+      """
+      self.track = track
+      self.n_cars = n_cars
+      self.crash_type = crash_type
+      self.rng = np.random.default_rng(seed)
+      self.actions = np.array(ACTIONS)
+      self.step_reward = step_reward
+      self.crash_reward = crash_reward
+      self.finish_reward = finish_reward
+      self.start_line = np.array(track.start_line, dtype=np.int64).reshape(-1, 2)
+      self.codec = StateCodec(*track.grid.shape)
+
+      self.y = np.zeros(n_cars, dtype=np.int64)
+      self.x = np.zeros(n_cars, dtype=np.int64)
+      self.vy = np.zeros(n_cars, dtype=np.int64)
+      self.vx = np.zeros(n_cars, dtype=np.int64)
+      self.done = np.zeros(n_cars, dtype=bool)
+      self.steps = np.zeros(n_cars, dtype=np.int64)
+      self.reset()
+
+   def reset(self, mask = None):
+      """Places cars on random starting points with zero velocity
+
+      Args:
+         mask (array): which cars to reset, or None to reset every car
+
+      Returns:
+         the states of all cars, one [y, x, vy, vx] per row
+      """
+      cars = np.arange(self.n_cars) if mask is None else np.flatnonzero(mask)
+      starts = self.start_line[self.rng.integers(len(self.start_line), size=len(cars))]
+      self.y[cars] = starts[:, 0]
+      self.x[cars] = starts[:, 1]
+      self.vy[cars] = 0
+      self.vx[cars] = 0
+      self.done[cars] = False
+      self.steps[cars] = 0
+      return self.states()
+
+   def step(self, actions):
+      """Advances every car that has not finished by one nondeterministic step
+      Each action is applied with probability 0.8, otherwise the car does not accelerate
+
+      Args:
+         actions (array): the action index of each car
+
+      Returns:
+         states (matrix): the new state of every car, one [y, x, vy, vx] per row
+         rewards (array): the reward of every car, 0 for cars that had already finished
+         done (array): True for every car that has finished
+      """
+      cars = np.flatnonzero(~self.done)
+      accelerations = self.actions[np.asarray(actions)[cars]]
+      accelerations[self.rng.random(len(cars)) > .8] = 0
+
+      # Velocities are clipped to range [-5, 5]
+      vy = np.clip(self.vy[cars] + accelerations[:, 0], -5, 5)
+      vx = np.clip(self.vx[cars] + accelerations[:, 1], -5, 5)
+      y = self.y[cars]
+      x = self.x[cars]
+
+      # Check if we finished and/or crashed (both can happen)
+      if self.track.collision_cache is not None:
+         finished, crashed, crash_points = self.track.collision_cache.lookup_batch(y, x, vy, vx)
+      else:
+         finished, crashed, crash_points = Helpers.trace_segments(np.stack((y, x), axis=-1), np.stack((y + vy, x + vx), axis=-1), self.track)
+
+      # Handle crashes, velocities get set to 0
+      if self.crash_type:
+         wall_crash = crashed & ~finished
+         crash_points[wall_crash] = Helpers.get_nearest_starts(self.track, crash_points[wall_crash])
+      self.y[cars] = np.where(crashed, crash_points[:, 0], y + vy)
+      self.x[cars] = np.where(crashed, crash_points[:, 1], x + vx)
+      self.vy[cars] = np.where(crashed, 0, vy)
+      self.vx[cars] = np.where(crashed, 0, vx)
+
+      rewards = np.zeros(self.n_cars, dtype=np.int64)
+      rewards[cars] = np.where(finished, self.finish_reward, np.where(crashed, self.crash_reward, self.step_reward))
+      self.done[cars] = finished
+      self.steps[cars] += 1
+      return self.states(), rewards, self.done.copy()
+
+   def states(self):
+      """Gets the state of every car
+
+      Returns:
+         the states of all cars, one [y, x, vy, vx] per row
+      """
+      return np.stack((self.y, self.x, self.vy, self.vx), axis=-1)
+
+   def state_indices(self):
+      """Gets the flat state index of every car, as used by TransitionModel and the learners' tables
+
+      Returns:
+         the flat state index of every car
+      """
+      return self.codec.encode(self.y, self.x, self.vy, self.vx)